@@ -15,6 +15,8 @@ class Settings(BaseSettings):
     # Embedding Configuration
     EMBEDDING_PROVIDER: str = "groq"  # or "local"
     LOCAL_EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    LOCAL_EMBEDDING_BACKEND: str = "torch"  # or "onnx-int8"
+    ONNX_MODEL_DIR: str = "/data/onnx_embedding_model"  # One subdirectory per exported model
     
     # ChromaDB Configuration
     CHROMA_PERSIST_DIR: str = "/data/chroma"
@@ -22,6 +24,8 @@ class Settings(BaseSettings):
     
     # RAG Configuration
     RETRIEVAL_TOP_K: int = 8
+    RETRIEVAL_OVERFETCH: int = 32  # Candidates fetched before distance filtering
+    RETRIEVAL_MAX_DISTANCE: float = 0.6  # Cosine distance cutoff for retrieved chunks
     CHUNK_SIZE_TOKENS: int = 500
     CHUNK_OVERLAP_TOKENS: int = 50
     MAX_CONVERSATION_HISTORY: int = 10
@@ -32,6 +36,7 @@ class Settings(BaseSettings):
     
     # Session Configuration
     SESSION_TIMEOUT_MINUTES: int = 60
+    REDIS_URL: str = ""  # e.g. redis://redis:6379/0 to share sessions across workers
     
     # CORS
     CORS_ORIGINS: List[str] = ["*"]  # Allow all origins for ChromaDB viewer
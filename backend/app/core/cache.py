@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Small in-process least-recently-used cache.
+    Evicts the oldest entry once maxsize is reached.
+    """
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+    
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+    
+    def __setitem__(self, key: Hashable, value: Any):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def clear(self):
+        self._data.clear()
+
+class TTLCache(LRUCache):
+    """
+    LRU cache whose entries also expire ttl seconds after being stored.
+    """
+    
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0):
+        super().__init__(maxsize)
+        self.ttl = ttl
+    
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        return value
+    
+    def __setitem__(self, key: Hashable, value: Any):
+        super().__setitem__(key, (time.monotonic() + self.ttl, value))
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
@@ -64,40 +64,12 @@ When provided with code context, analyze:
 Remember: You're not just generating code, you're helping build and maintain a cohesive, professional software system.
 """
 
-def build_code_generation_prompt(
-    context: str,
-    request: str,
-    conversation_history: List[Dict],
-    project_info: Dict[str, Any] = None
-) -> str:
-    """Build specialized prompt for code generation tasks"""
-    
-    # Analyze request type
-    request_lower = request.lower()
-    task_type = "general"
-    
-    if any(word in request_lower for word in ["create", "generate", "write", "implement", "build"]):
-        task_type = "generation"
-    elif any(word in request_lower for word in ["fix", "debug", "error", "bug", "issue", "problem"]):
-        task_type = "debugging"
-    elif any(word in request_lower for word in ["review", "improve", "optimize", "refactor"]):
-        task_type = "review"
-    elif any(word in request_lower for word in ["explain", "how", "what", "why", "understand"]):
-        task_type = "explanation"
-    
-    # Build context analysis
-    context_analysis = _analyze_code_context(context)
-    
-    # Build conversation context
-    history_text = ""
-    if conversation_history:
-        for msg in conversation_history[-3:]:  # Last 3 exchanges
-            role = "User" if msg['role'] == 'user' else "Assistant"
-            history_text += f"{role}: {msg['content'][:200]}...\n\n"
-    
-    # Task-specific instructions
-    task_instructions = {
-        "generation": """
+# Task-specific instructions appended to the system prompt. Everything in the
+# system message is static per task, so the prompt prefix is byte-identical
+# across requests and can be served from the provider's prompt cache.
+# Dynamic content (history, retrieved context, the query) always comes last.
+TASK_INSTRUCTIONS = {
+    "generation": """
 ## Code Generation Task
 Focus on:
 - Following existing patterns and conventions
@@ -105,26 +77,17 @@ Focus on:
 - Including proper error handling and validation
 - Adding appropriate documentation and comments
 - Considering scalability and maintainability
+
+## Instructions
+Provide a comprehensive response that addresses the user's request while considering the project context and maintaining consistency with existing code patterns. Be specific, practical, and include code examples when appropriate.
+
+Response Format:
+1. **Analysis**: What I understand from your request and the codebase
+2. **Solution**: The code/guidance you requested with explanations
+3. **Integration**: How this fits with your existing code
+4. **Next Steps**: Suggested follow-up actions or improvements
 """,
-        "debugging": """
-## Debugging Task
-Focus on:
-- Identifying the root cause of the issue
-- Analyzing error context against the codebase
-- Providing specific, actionable fixes
-- Explaining why the error occurred
-- Suggesting prevention strategies
-""",
-        "review": """
-## Code Review Task
-Focus on:
-- Identifying potential bugs and security issues
-- Suggesting performance improvements
-- Recommending best practices
-- Ensuring code follows project conventions
-- Proposing refactoring opportunities
-""",
-        "explanation": """
+    "explanation": """
 ## Code Explanation Task
 Focus on:
 - Breaking down complex concepts clearly
@@ -132,25 +95,17 @@ Focus on:
 - Providing practical examples
 - Highlighting important patterns and practices
 - Connecting to broader architectural decisions
-"""
-    }
-    
-    return f"""{ENHANCED_CODE_ASSISTANT_PROMPT}
-
-{task_instructions.get(task_type, "")}
 
-## Project Context Analysis
-{context_analysis}
-
-## Relevant Code from Project
-{context}
-
-## Recent Conversation
-{history_text}
-
-## Current Request
-User: {request}
+## Instructions
+Provide a comprehensive response that addresses the user's request while considering the project context and maintaining consistency with existing code patterns. Be specific, practical, and include code examples when appropriate.
 
+Response Format:
+1. **Analysis**: What I understand from your request and the codebase
+2. **Solution**: The code/guidance you requested with explanations
+3. **Integration**: How this fits with your existing code
+4. **Next Steps**: Suggested follow-up actions or improvements
+""",
+    "general": """
 ## Instructions
 Provide a comprehensive response that addresses the user's request while considering the project context and maintaining consistency with existing code patterns. Be specific, practical, and include code examples when appropriate.
 
@@ -159,7 +114,107 @@ Response Format:
 2. **Solution**: The code/guidance you requested with explanations
 3. **Integration**: How this fits with your existing code
 4. **Next Steps**: Suggested follow-up actions or improvements
+""",
+    "debugging": """
+## Debugging Task
+You are helping debug an issue. Focus on:
+- Analyzing the error message in context of the codebase
+- Identifying the root cause
+- Providing specific, actionable fixes
+- Explaining why the error occurred
+- Suggesting prevention strategies
+
+## Instructions
+1. **Error Analysis**: Explain what the error means and why it's occurring
+2. **Root Cause**: Identify the underlying issue in the code
+3. **Fix**: Provide specific code changes to resolve the issue
+4. **Prevention**: Suggest how to prevent similar issues in the future
+""",
+    "architecture": """
+## Architecture & Design Task
+You are providing architectural guidance. Focus on:
+- Understanding the current system architecture
+- Suggesting improvements that fit the existing patterns
+- Recommending scalable and maintainable solutions
+- Considering performance, security, and best practices
+
+## Instructions
+1. **Current Architecture**: Analyze the existing system design
+2. **Recommendations**: Suggest specific architectural improvements
+3. **Implementation**: Provide concrete steps and code examples
+4. **Trade-offs**: Discuss benefits and potential challenges
+""",
+    "review": """
+## Code Review Task
+You are conducting a thorough code review. Focus on:
+- Identifying bugs, security issues, and performance problems
+- Checking adherence to project conventions and best practices
+- Suggesting improvements for readability and maintainability
+- Ensuring proper error handling and edge case coverage
+
+## Instructions
+Provide a comprehensive code review covering:
+1. **Issues Found**: Bugs, security concerns, performance problems
+2. **Best Practices**: Adherence to coding standards and conventions
+3. **Improvements**: Suggestions for better code quality
+4. **Positive Aspects**: What's done well in the code
+"""
+}
+
+# Complete system prompt per task, built once at import
+TASK_SYSTEM_PROMPTS = {
+    task: f"{ENHANCED_CODE_ASSISTANT_PROMPT}\n{instructions}"
+    for task, instructions in TASK_INSTRUCTIONS.items()
+}
+
+# Number of prior messages passed to the model as conversation turns
+PROMPT_HISTORY_MESSAGES = 6
+
+def detect_generation_task(request: str) -> str:
+    """Refine a generation-category request into a specific task type"""
+    request_lower = request.lower()
+    
+    if any(word in request_lower for word in ["create", "generate", "write", "implement", "build"]):
+        return "generation"
+    elif any(word in request_lower for word in ["fix", "debug", "error", "bug", "issue", "problem"]):
+        return "debugging"
+    elif any(word in request_lower for word in ["review", "improve", "optimize", "refactor"]):
+        return "review"
+    elif any(word in request_lower for word in ["explain", "how", "what", "why", "understand"]):
+        return "explanation"
+    return "general"
+
+def build_code_assistant_messages(
+    task: str,
+    context: str,
+    request: str,
+    conversation_history: List[Dict]
+) -> List[Dict[str, str]]:
+    """
+    Build chat messages for a code assistant task:
+    static system prompt, then prior turns, then context and the request.
+    """
+    messages = [{"role": "system", "content": TASK_SYSTEM_PROMPTS.get(task, TASK_SYSTEM_PROMPTS["general"])}]
+    
+    for msg in conversation_history[-PROMPT_HISTORY_MESSAGES:]:
+        messages.append({"role": msg["role"], "content": msg["content"]})
+    
+    messages.append({
+        "role": "user",
+        "content": f"""## Project Context Analysis
+{_analyze_code_context(context)}
+
+## Relevant Code from Project
+<context>
+{context}
+</context>
+
+## Current Request
+{request}
 """
+    })
+    
+    return messages
 
 def _analyze_code_context(context: str) -> str:
     """Analyze the provided code context to understand project patterns"""
@@ -261,107 +316,3 @@ def _analyze_code_context(context: str) -> str:
         analysis_parts.append(f"**Configuration**: {', '.join(config)}")
     
     return "\n".join(analysis_parts) if analysis_parts else "**Context**: General code analysis"
-
-def build_debugging_prompt(
-    context: str,
-    error_message: str,
-    conversation_history: List[Dict]
-) -> str:
-    """Build specialized prompt for debugging tasks"""
-    
-    context_analysis = _analyze_code_context(context)
-    
-    return f"""{ENHANCED_CODE_ASSISTANT_PROMPT}
-
-## Debugging Task
-You are helping debug an issue. Focus on:
-- Analyzing the error message in context of the codebase
-- Identifying the root cause
-- Providing specific, actionable fixes
-- Explaining why the error occurred
-- Suggesting prevention strategies
-
-## Project Context Analysis
-{context_analysis}
-
-## Relevant Code from Project
-{context}
-
-## Error Information
-{error_message}
-
-## Instructions
-1. **Error Analysis**: Explain what the error means and why it's occurring
-2. **Root Cause**: Identify the underlying issue in the code
-3. **Fix**: Provide specific code changes to resolve the issue
-4. **Prevention**: Suggest how to prevent similar issues in the future
-"""
-
-def build_architecture_prompt(
-    context: str,
-    request: str,
-    conversation_history: List[Dict]
-) -> str:
-    """Build specialized prompt for architecture and design questions"""
-    
-    context_analysis = _analyze_code_context(context)
-    
-    return f"""{ENHANCED_CODE_ASSISTANT_PROMPT}
-
-## Architecture & Design Task
-You are providing architectural guidance. Focus on:
-- Understanding the current system architecture
-- Suggesting improvements that fit the existing patterns
-- Recommending scalable and maintainable solutions
-- Considering performance, security, and best practices
-
-## Project Context Analysis
-{context_analysis}
-
-## Relevant Code from Project
-{context}
-
-## Architecture Request
-{request}
-
-## Instructions
-1. **Current Architecture**: Analyze the existing system design
-2. **Recommendations**: Suggest specific architectural improvements
-3. **Implementation**: Provide concrete steps and code examples
-4. **Trade-offs**: Discuss benefits and potential challenges
-"""
-
-def build_code_review_prompt(
-    context: str,
-    code_to_review: str,
-    conversation_history: List[Dict]
-) -> str:
-    """Build specialized prompt for code review tasks"""
-    
-    context_analysis = _analyze_code_context(context)
-    
-    return f"""{ENHANCED_CODE_ASSISTANT_PROMPT}
-
-## Code Review Task
-You are conducting a thorough code review. Focus on:
-- Identifying bugs, security issues, and performance problems
-- Checking adherence to project conventions and best practices
-- Suggesting improvements for readability and maintainability
-- Ensuring proper error handling and edge case coverage
-
-## Project Context Analysis
-{context_analysis}
-
-## Existing Codebase Context
-{context}
-
-## Code to Review
-{code_to_review}
-
-## Instructions
-Provide a comprehensive code review covering:
-1. **Issues Found**: Bugs, security concerns, performance problems
-2. **Best Practices**: Adherence to coding standards and conventions
-3. **Improvements**: Suggestions for better code quality
-4. **Positive Aspects**: What's done well in the code
-"""
@@ -60,16 +60,21 @@ async def process_data_directory(rag_pipeline):
             try:
                 logger.info(f"Processing file: {file_path}")
                 
-                # Read file content
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                # Read file content; CSV files are streamed from disk by the pipeline
+                if file_path.suffix.lower() == '.csv':
+                    content = file_path
+                    file_size = file_path.stat().st_size
+                else:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    file_size = len(content)
                 
                 # Create metadata
                 metadata = {
                     'file_name': file_path.name,
                     'file_path': str(file_path),
                     'file_type': file_path.suffix,  # Keep the dot for chunking service
-                    'file_size': len(content),
+                    'file_size': file_size,
                     'source': 'data_directory'
                 }
                 
@@ -94,16 +99,16 @@ async def startup_event():
     
     try:
         # Initialize and test services
-        from app.services.embedding_service import EmbeddingService
-        from app.services.vectorstore_service import VectorStoreService
+        from app.services.embedding_service import get_embedding_service
+        from app.services.vectorstore_service import get_vectorstore_service
         from app.services.rag_pipeline import RAGPipeline
         
         # Test embedding service
-        embedding_service = EmbeddingService()
+        embedding_service = get_embedding_service()
         logger.info(f"Embedding service initialized (provider: {embedding_service.embedding_provider})")
         
         # Test vector store
-        vectorstore_service = VectorStoreService()
+        vectorstore_service = get_vectorstore_service()
         if vectorstore_service.health_check():
             logger.info("ChromaDB connection successful")
         else:
@@ -133,11 +138,11 @@ async def shutdown_event():
 async def health_check():
     """Health check endpoint"""
     try:
-        from app.services.vectorstore_service import VectorStoreService
+        from app.services.vectorstore_service import get_vectorstore_service
         from app.services.rag_pipeline import RAGPipeline
         
         # Check ChromaDB
-        vectorstore_service = VectorStoreService()
+        vectorstore_service = get_vectorstore_service()
         chroma_healthy = vectorstore_service.health_check()
         
         # Check RAG pipeline
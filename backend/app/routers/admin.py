@@ -9,8 +9,8 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Initialize services
-from app.services.vectorstore_service import VectorStoreService
-vectorstore_service = VectorStoreService()
+from app.services.vectorstore_service import get_vectorstore_service
+vectorstore_service = get_vectorstore_service()
 rag_pipeline = RAGPipeline()
 
 @router.get("/test")
@@ -118,7 +118,7 @@ async def search_documents(query: str, limit: int = 10) -> Dict[str, Any]:
             "results_count": len(results.get('documents', [])),
             "documents": results.get('documents', []),
             "metadatas": results.get('metadatas', []),
-            "distances": results.get('distances', [])
+            "distances": results['distances'].tolist()
         }
         
     except Exception as e:
@@ -199,16 +199,21 @@ async def process_data_files() -> Dict[str, Any]:
                 try:
                     logger.info(f"Processing file: {file_path}")
                     
-                    # Read file content
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
+                    # Read file content; CSV files are streamed from disk by the pipeline
+                    if file_path.suffix.lower() == '.csv':
+                        content = file_path
+                        file_size = file_path.stat().st_size
+                    else:
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            content = f.read()
+                        file_size = len(content)
                     
                     # Create metadata
                     metadata = {
                         'file_name': file_path.name,
                         'file_path': str(file_path),
                         'file_type': file_path.suffix,  # Keep the dot for chunking service
-                        'file_size': len(content),
+                        'file_size': file_size,
                         'source': 'manual_processing'
                     }
                     
@@ -6,7 +6,7 @@ import json
 
 from app.models.chat import ChatRequest, ChatResponse
 from app.services.llm_service import LLMService
-from app.services.session_service import SessionService
+from app.services.session_service import get_session_service
 from app.services.rag_pipeline import RAGPipeline
 
 logger = logging.getLogger(__name__)
@@ -15,7 +15,7 @@ router = APIRouter()
 
 # Initialize services
 llm_service = LLMService()
-session_service = SessionService()
+session_service = get_session_service()
 rag_pipeline = RAGPipeline()
 
 async def should_use_rag(message: str) -> bool:
@@ -64,13 +64,13 @@ async def chat_general(request: ChatRequest):
     """
     try:
         # Get or create session
-        session_id = session_service.get_or_create_session(request.session_id, "general")
+        session_id = await session_service.get_or_create_session(request.session_id, "general")
         
         # Get conversation history
-        conversation_history = session_service.get_conversation_history(session_id)
+        conversation_history = await session_service.get_conversation_history(session_id)
         
         # Add user message to history
-        session_service.add_message_to_history(session_id, "user", request.message)
+        await session_service.add_message_to_history(session_id, "user", request.message)
         
         # Format messages for LLM
         messages = llm_service.format_messages_for_general_chat(
@@ -87,7 +87,7 @@ async def chat_general(request: ChatRequest):
                 yield f"data: {json.dumps({'token': token, 'session_id': session_id})}\n\n"
             
             # Add assistant response to history
-            session_service.add_message_to_history(session_id, "assistant", full_response)
+            await session_service.add_message_to_history(session_id, "assistant", full_response)
             
             # Send completion signal
             yield f"data: {json.dumps({'token': '', 'session_id': session_id, 'complete': True})}\n\n"
@@ -98,6 +98,7 @@ async def chat_general(request: ChatRequest):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
                 "Access-Control-Allow-Origin": "*"
             }
         )
@@ -114,13 +115,13 @@ async def chat_code_assistant(request: ChatRequest):
     """
     try:
         # Get or create session
-        session_id = session_service.get_or_create_session(request.session_id, "code_assistant")
+        session_id = await session_service.get_or_create_session(request.session_id, "code_assistant")
         
         # Get conversation history
-        conversation_history = session_service.get_conversation_history(session_id)
+        conversation_history = await session_service.get_conversation_history(session_id)
         
         # Add user message to history
-        session_service.add_message_to_history(session_id, "user", request.message)
+        await session_service.add_message_to_history(session_id, "user", request.message)
         
         # Smart routing: Check if query needs RAG or just general LLM
         needs_rag = await should_use_rag(request.message)
@@ -145,7 +146,7 @@ async def chat_code_assistant(request: ChatRequest):
                     yield f"data: {json.dumps({'token': token, 'session_id': session_id})}\n\n"
                 
                 # Add assistant response to history
-                session_service.add_message_to_history(session_id, "assistant", full_response)
+                await session_service.add_message_to_history(session_id, "assistant", full_response)
                 
                 # Send completion signal
                 yield f"data: {json.dumps({'token': '', 'session_id': session_id, 'complete': True})}\n\n"
@@ -168,7 +169,7 @@ async def chat_code_assistant(request: ChatRequest):
                     yield f"data: {json.dumps({'token': token, 'session_id': session_id})}\n\n"
                 
                 # Add assistant response to history
-                session_service.add_message_to_history(session_id, "assistant", full_response)
+                await session_service.add_message_to_history(session_id, "assistant", full_response)
                 
                 # Send completion signal
                 yield f"data: {json.dumps({'token': '', 'session_id': session_id, 'complete': True})}\n\n"
@@ -179,6 +180,7 @@ async def chat_code_assistant(request: ChatRequest):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
                 "Access-Control-Allow-Origin": "*"
             }
         )
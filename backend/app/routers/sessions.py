@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from typing import List, Dict
 from app.models.session import ConversationHistory, SessionClearResponse
-from app.services.session_service import SessionService
+from app.services.session_service import get_session_service
 
 router = APIRouter()
 
 # Initialize session service
-session_service = SessionService()
+session_service = get_session_service()
 
 @router.get("/{session_id}/history")
 async def get_session_history(session_id: str) -> ConversationHistory:
@@ -14,7 +14,7 @@ async def get_session_history(session_id: str) -> ConversationHistory:
     Get conversation history for a session
     """
     try:
-        messages = session_service.get_conversation_history(session_id)
+        messages = await session_service.get_conversation_history(session_id)
         
         return ConversationHistory(
             session_id=session_id,
@@ -31,7 +31,7 @@ async def clear_session_history(session_id: str) -> SessionClearResponse:
     Clear conversation history for a session
     """
     try:
-        messages_cleared = session_service.clear_conversation_history(session_id)
+        messages_cleared = await session_service.clear_conversation_history(session_id)
         
         return SessionClearResponse(
             status="cleared",
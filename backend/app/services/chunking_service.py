@@ -1,10 +1,55 @@
+import asyncio
 import re
-from typing import List, Dict, Any
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple
 import logging
+from app.core.cache import LRUCache
 from app.core.constants import LANGUAGE_MAPPING, CHUNKING_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Chunks of recently seen documents, keyed by content digest plus the metadata
+# fields that select and label the chunking strategy (see CHUNK_KEY_FIELDS).
+# Shared by all ChunkingService instances; chunking may run in worker threads.
+_CHUNK_CACHE = LRUCache(maxsize=256)
+_CHUNK_CACHE_LOCK = threading.Lock()
+
+# The only metadata fields chunking reads; everything else is carried through
+CHUNK_KEY_FIELDS = ('file_type', 'filename')
+
+@dataclass(slots=True)
+class ChunkBatch:
+    """
+    Column-oriented view of a list of chunks: one list per field, so bulk
+    consumers index parallel lists instead of looking up each chunk's dict
+    """
+    contents: List[str]
+    metadatas: List[Dict[str, Any]]
+    chunk_types: List[str]
+    function_names: List[str]
+    section_titles: List[str]
+    start_lines: List[int]
+    end_lines: List[int]
+    
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]]) -> "ChunkBatch":
+        metadatas = [chunk['metadata'] for chunk in chunks]
+        return cls(
+            contents=[chunk['content'] for chunk in chunks],
+            metadatas=metadatas,
+            chunk_types=[meta.get('chunk_type', 'unknown') for meta in metadatas],
+            function_names=[meta.get('function_name', '') for meta in metadatas],
+            section_titles=[meta.get('section_title', '') for meta in metadatas],
+            start_lines=[meta.get('start_line', 0) for meta in metadatas],
+            end_lines=[meta.get('end_line', 0) for meta in metadatas]
+        )
+    
+    def __len__(self) -> int:
+        return len(self.contents)
+
 class ChunkingService:
     """
     Different chunking strategies for different file types.
@@ -21,35 +66,75 @@ class ChunkingService:
         metadata: Dict[str, Any]
     ) -> List[Dict[str, Any]]:
         """
-        Main chunking method that routes to appropriate strategy
+        Main chunking method that routes to appropriate strategy.
+        Chunking is CPU-bound, so it runs in a worker thread off the event loop.
+        """
+        return await asyncio.to_thread(self.chunk_document_sync, content, metadata)
+    
+    def chunk_document_sync(
+        self, 
+        content: str, 
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """
+        Synchronous chunking; the work is CPU-bound, so callers can run it
+        directly or in a worker thread without a coroutine per strategy.
+        Results are memoized on the content and CHUNK_KEY_FIELDS only, so
+        re-chunking an unchanged document is a lookup even when the rest of
+        its metadata (such as upload timestamps) differs between calls.
         """
+        key_metadata = {field: metadata[field] for field in CHUNK_KEY_FIELDS if field in metadata}
+        key = self._chunk_cache_key(content, key_metadata)
+        with _CHUNK_CACHE_LOCK:
+            cached = _CHUNK_CACHE.get(key)
+        
+        if cached is None:
+            cached = self._chunk_uncached(content, key_metadata)
+            with _CHUNK_CACHE_LOCK:
+                _CHUNK_CACHE[key] = cached
+        
+        # Strategies copy the document metadata and add chunk fields on top, so
+        # layering the cached chunk metadata over the caller's reproduces that;
+        # callers annotate chunk metadata in place, so every chunk gets a new dict
+        return [{**chunk, 'metadata': {**metadata, **chunk['metadata']}} for chunk in cached]
+    
+    def _chunk_cache_key(self, content: str, key_metadata: Dict[str, Any]) -> Tuple[bytes, str]:
+        digest = hashlib.blake2b(content.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+        return digest, json.dumps(key_metadata, sort_keys=True, default=str)
+    
+    def _chunk_uncached(
+        self, 
+        content: str, 
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Route content to the chunking strategy for its file type"""
         file_type = metadata.get('file_type', '.txt')
         filename = metadata.get('filename', 'unknown')
         
         try:
             if file_type in ['.py', '.js', '.ts', '.jsx', '.tsx', '.java', '.cpp', '.c', '.h', 
                            '.go', '.rs', '.rb', '.php', '.swift', '.kt', '.scala']:
-                return await self.chunk_code(content, metadata)
+                return self.chunk_code(content, metadata)
             elif file_type in ['.json', '.yaml', '.yml', '.toml', '.ini', '.xml', '.properties']:
-                return await self.chunk_config(content, metadata)
+                return self.chunk_config(content, metadata)
             elif file_type in ['.md', '.txt', '.rst']:
-                return await self.chunk_document_text(content, metadata)
+                return self.chunk_document_text(content, metadata)
             elif file_type == '.sql':
-                return await self.chunk_sql(content, metadata)
+                return self.chunk_sql(content, metadata)
             elif file_type in ['.html', '.css', '.scss', '.sass']:
-                return await self.chunk_web(content, metadata)
+                return self.chunk_web(content, metadata)
             elif file_type == '.csv':
-                return await self.chunk_csv(content, metadata)
+                return self.chunk_csv(content, metadata)
             else:
                 # Default chunking for unknown types
-                return await self.chunk_generic(content, metadata)
+                return self.chunk_generic(content, metadata)
                 
         except Exception as e:
             logger.error(f"Error chunking {filename}: {str(e)}")
             # Fallback to generic chunking
-            return await self.chunk_generic(content, metadata)
+            return self.chunk_generic(content, metadata)
     
-    async def chunk_code(
+    def chunk_code(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -66,7 +151,7 @@ class ChunkingService:
         
         try:
             # Try to use tree-sitter for AST-based chunking
-            ast_chunks = await self._chunk_with_ast(content, language, metadata)
+            ast_chunks = self._chunk_with_ast(content, language, metadata)
             if ast_chunks:
                 return ast_chunks
         except Exception as e:
@@ -74,16 +159,16 @@ class ChunkingService:
         
         # Fallback to regex-based function detection
         try:
-            regex_chunks = await self._chunk_with_regex(content, language, metadata)
+            regex_chunks = self._chunk_with_regex(content, language, metadata)
             if regex_chunks:
                 return regex_chunks
         except Exception as e:
             logger.warning(f"Regex chunking failed for {filename}, falling back to line-based: {str(e)}")
         
         # Final fallback to line-based chunking
-        return await self._chunk_by_lines(content, metadata, preserve_structure=True)
+        return self._chunk_by_lines(content, metadata, preserve_structure=True)
     
-    async def _chunk_with_ast(
+    def _chunk_with_ast(
         self, 
         content: str, 
         language: str, 
@@ -183,7 +268,7 @@ class ChunkingService:
             logger.error(f"AST chunking error: {str(e)}")
             return []
     
-    async def _chunk_with_regex(
+    def _chunk_with_regex(
         self, 
         content: str, 
         language: str, 
@@ -281,7 +366,7 @@ class ChunkingService:
         
         return ""
     
-    async def chunk_config(
+    def chunk_config(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -304,9 +389,9 @@ class ChunkingService:
             }]
         
         # For large configs, split by top-level sections
-        return await self._chunk_by_lines(content, metadata, chunk_size=800)
+        return self._chunk_by_lines(content, metadata, chunk_size=800)
     
-    async def chunk_document_text(
+    def chunk_document_text(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -317,11 +402,11 @@ class ChunkingService:
         file_type = metadata.get('file_type', '.txt')
         
         if file_type == '.md':
-            return await self._chunk_markdown(content, metadata)
+            return self._chunk_markdown(content, metadata)
         else:
-            return await self._chunk_by_paragraphs(content, metadata)
+            return self._chunk_by_paragraphs(content, metadata)
     
-    async def _chunk_markdown(
+    def _chunk_markdown(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -340,7 +425,7 @@ class ChunkingService:
         
         if not header_indices:
             # No headers, chunk by paragraphs
-            return await self._chunk_by_paragraphs(content, metadata)
+            return self._chunk_by_paragraphs(content, metadata)
         
         # Create chunks based on headers
         for i, start in enumerate(header_indices):
@@ -368,7 +453,7 @@ class ChunkingService:
         
         return chunks
     
-    async def _chunk_by_paragraphs(
+    def _chunk_by_paragraphs(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -425,7 +510,7 @@ class ChunkingService:
         
         return chunks
     
-    async def chunk_sql(
+    def chunk_sql(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -467,7 +552,7 @@ class ChunkingService:
         
         return chunks
     
-    async def chunk_web(
+    def chunk_web(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -475,9 +560,9 @@ class ChunkingService:
         """
         Chunk HTML/CSS files
         """
-        return await self._chunk_by_lines(content, metadata, chunk_size=800)
+        return self._chunk_by_lines(content, metadata, chunk_size=800)
     
-    async def chunk_generic(
+    def chunk_generic(
         self, 
         content: str, 
         metadata: Dict[str, Any]
@@ -485,9 +570,9 @@ class ChunkingService:
         """
         Generic chunking for unknown file types
         """
-        return await self._chunk_by_lines(content, metadata)
+        return self._chunk_by_lines(content, metadata)
     
-    async def _chunk_by_lines(
+    def _chunk_by_lines(
         self, 
         content: str, 
         metadata: Dict[str, Any], 
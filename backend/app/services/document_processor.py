@@ -1,4 +1,7 @@
+import asyncio
+import codecs
 import os
+import tempfile
 import chardet
 from pathlib import Path
 from typing import Tuple, Dict, Any
@@ -74,6 +77,15 @@ class DocumentProcessor:
             '.bat': self._process_code,
             '.ps1': self._process_code,
         }
+        
+        # Text handlers whose formatting can run on in-memory content
+        self.text_formatters = {
+            self._process_code: self._format_code,
+            self._process_config: self._format_config,
+            self._process_markdown: self._format_plain,
+            self._process_text: self._format_plain,
+            self._process_sql: self._format_sql,
+        }
     
     async def process_file(
         self, 
@@ -84,19 +96,7 @@ class DocumentProcessor:
         Process file and return (text_content, metadata)
         """
         try:
-            ext = Path(filename).suffix.lower()
-            
-            # Handle special cases (files without extensions)
-            if not ext:
-                if filename.lower() in ['dockerfile', 'makefile', 'readme']:
-                    ext = '.txt'
-                elif filename.startswith('.'):
-                    ext = '.txt'
-                else:
-                    raise ValueError(f"Unknown file type: {filename}")
-            
-            if ext not in self.handlers:
-                raise ValueError(f"Unsupported file type: {ext}")
+            ext = self._resolve_extension(filename)
             
             # Detect encoding for text files
             encoding = self._detect_encoding(file_path)
@@ -119,41 +119,126 @@ class DocumentProcessor:
             logger.error(f"Error processing file {filename}: {str(e)}")
             raise
     
+    async def process_bytes(
+        self, 
+        data: bytes, 
+        filename: str
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Process in-memory file content and return (text_content, metadata).
+        Text formats never touch disk; binary formats go through a temp file.
+        """
+        try:
+            ext = self._resolve_extension(filename)
+            handler = self.handlers[ext]
+            encoding = self._detect_bytes_encoding(data[:10000])
+            
+            if handler in self.text_formatters:
+                content = self.text_formatters[handler](data.decode(encoding, errors='replace'), ext)
+            else:
+                with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_file:
+                    tmp_file.write(data)
+                try:
+                    content = await handler(tmp_file.name, encoding)
+                finally:
+                    os.unlink(tmp_file.name)
+            
+            metadata = {
+                'filename': filename,
+                'file_type': ext,
+                'file_size': len(data),
+                'encoding': encoding,
+                'processed_at': None  # Will be set when adding to vector store
+            }
+            
+            return content, metadata
+            
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {str(e)}")
+            raise
+    
+    def _resolve_extension(self, filename: str) -> str:
+        """Map a filename to a supported handler extension"""
+        ext = Path(filename).suffix.lower()
+        
+        # Handle special cases (files without extensions)
+        if not ext:
+            if filename.lower() in ['dockerfile', 'makefile', 'readme']:
+                ext = '.txt'
+            elif filename.startswith('.'):
+                ext = '.txt'
+            else:
+                raise ValueError(f"Unknown file type: {filename}")
+        
+        if ext not in self.handlers:
+            raise ValueError(f"Unsupported file type: {ext}")
+        
+        return ext
+    
     def _detect_encoding(self, file_path: str) -> str:
         """Detect file encoding"""
         try:
             with open(file_path, 'rb') as f:
                 raw_data = f.read(10000)  # Read first 10KB
-                result = chardet.detect(raw_data)
-                encoding = result.get('encoding', 'utf-8')
-                
-                # Fallback to common encodings
-                if not encoding or result.get('confidence', 0) < 0.7:
-                    for fallback in ['utf-8', 'latin-1', 'cp1252']:
-                        try:
-                            with open(file_path, 'r', encoding=fallback) as test_file:
-                                test_file.read(1000)
-                            return fallback
-                        except UnicodeDecodeError:
-                            continue
-                    return 'utf-8'  # Final fallback
-                
-                return encoding
+            return self._detect_bytes_encoding(raw_data)
                 
         except Exception:
             return 'utf-8'
     
+    def _detect_bytes_encoding(self, raw_data: bytes) -> str:
+        """Detect the encoding of raw file bytes"""
+        try:
+            result = chardet.detect(raw_data)
+            encoding = result.get('encoding', 'utf-8')
+            
+            # Fallback to common encodings
+            if not encoding or result.get('confidence', 0) < 0.7:
+                for fallback in ['utf-8', 'latin-1', 'cp1252']:
+                    try:
+                        # Incremental decode tolerates a multi-byte character cut at the end
+                        codecs.getincrementaldecoder(fallback)().decode(raw_data[:4000], final=False)
+                        return fallback
+                    except UnicodeDecodeError:
+                        continue
+                return 'utf-8'  # Final fallback
+            
+            return encoding
+            
+        except Exception:
+            return 'utf-8'
+    
+    def _format_code(self, content: str, ext: str) -> str:
+        # Basic validation
+        if not content.strip():
+            return "# Empty file"
+        return content
+    
+    def _format_config(self, content: str, ext: str) -> str:
+        # Add context for config files
+        config_type = {
+            '.json': 'JSON Configuration',
+            '.yaml': 'YAML Configuration',
+            '.yml': 'YAML Configuration',
+            '.toml': 'TOML Configuration',
+            '.ini': 'INI Configuration',
+            '.xml': 'XML Configuration',
+            '.properties': 'Properties Configuration'
+        }.get(ext, 'Configuration')
+        return f"# {config_type} File\n\n{content}"
+    
+    def _format_plain(self, content: str, ext: str) -> str:
+        return content
+    
+    def _format_sql(self, content: str, ext: str) -> str:
+        return f"-- SQL Database Script\n\n{content}"
+    
     async def _process_code(self, file_path: str, encoding: str) -> str:
         """Read code file, preserve structure"""
         try:
             with open(file_path, 'r', encoding=encoding) as f:
                 content = f.read()
             
-            # Basic validation
-            if not content.strip():
-                return "# Empty file"
-            
-            return content
+            return self._format_code(content, Path(file_path).suffix.lower())
             
         except Exception as e:
             logger.error(f"Error reading code file {file_path}: {str(e)}")
@@ -165,19 +250,7 @@ class DocumentProcessor:
             with open(file_path, 'r', encoding=encoding) as f:
                 content = f.read()
             
-            # Add context for config files
-            ext = Path(file_path).suffix.lower()
-            config_type = {
-                '.json': 'JSON Configuration',
-                '.yaml': 'YAML Configuration',
-                '.yml': 'YAML Configuration',
-                '.toml': 'TOML Configuration',
-                '.ini': 'INI Configuration',
-                '.xml': 'XML Configuration',
-                '.properties': 'Properties Configuration'
-            }.get(ext, 'Configuration')
-            
-            return f"# {config_type} File\n\n{content}"
+            return self._format_config(content, Path(file_path).suffix.lower())
             
         except Exception as e:
             logger.error(f"Error reading config file {file_path}: {str(e)}")
@@ -251,7 +324,7 @@ class DocumentProcessor:
             with open(file_path, 'r', encoding=encoding) as f:
                 content = f.read()
             
-            return f"-- SQL Database Script\n\n{content}"
+            return self._format_sql(content, Path(file_path).suffix.lower())
             
         except Exception as e:
             logger.error(f"Error reading SQL file {file_path}: {str(e)}")
@@ -319,3 +392,16 @@ class DocumentProcessor:
         except Exception as e:
             logger.error(f"Error reading Excel {file_path}: {str(e)}")
             return f"# Error reading Excel: {str(e)}"
+
+# Per-worker-process parser and event loop, created on the first file a worker handles.
+# Kept in this module so spawned workers only import the parsing dependencies.
+_worker_processor = None
+_worker_loop = None
+
+def process_file_sync(file_path: str, filename: str) -> Tuple[str, Dict[str, Any]]:
+    """Run DocumentProcessor.process_file to completion; executed in a worker process"""
+    global _worker_processor, _worker_loop
+    if _worker_processor is None:
+        _worker_processor = DocumentProcessor()
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop.run_until_complete(_worker_processor.process_file(file_path, filename))
@@ -1,8 +1,12 @@
 import asyncio
+import functools
+import os
+from pathlib import Path
 from typing import List, Union
 import logging
 import hashlib
 import json
+import numpy as np
 from groq import Groq
 
 from app.config import settings
@@ -10,15 +14,60 @@ from app.config import settings
 # Try to import sentence_transformers, but don't fail if not available
 try:
     from sentence_transformers import SentenceTransformer
-    import numpy as np
+    import torch
+    import torch.nn.functional as F
     SENTENCE_TRANSFORMERS_AVAILABLE = True
 except ImportError:
     SENTENCE_TRANSFORMERS_AVAILABLE = False
     SentenceTransformer = None
-    np = None
+    torch = None
+
+# Optional ONNX Runtime backend with dynamic INT8 quantization (CPU, AVX-512 VNNI)
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+    from huggingface_hub import hf_hub_download
+    import onnxruntime as ort
+    ONNX_RUNTIME_AVAILABLE = True
+except ImportError:
+    ONNX_RUNTIME_AVAILABLE = False
+    ort = None
 
 logger = logging.getLogger(__name__)
 
+# Maximum concurrent single-text embedding calls when batching isn't available
+EMBED_CONCURRENCY = 8
+
+# Sequence lengths are padded to these multiples so matmuls land on tensor-core tiles
+FP16_PAD_MULTIPLE = 8
+INT8_PAD_MULTIPLE = 16
+
+# sentence-transformers pooling config keys, in the order they are checked
+POOLING_MODES = {
+    "cls": "pooling_mode_cls_token",
+    "max": "pooling_mode_max_tokens",
+    "mean_sqrt_len": "pooling_mode_mean_sqrt_len_tokens",
+    "mean": "pooling_mode_mean_tokens"
+}
+
+def _read_pooling_mode(model_id: str) -> str:
+    """Pooling mode from a sentence-transformers model's 1_Pooling config; mean if absent"""
+    try:
+        if Path(model_id).is_dir():
+            config_path = Path(model_id) / "1_Pooling" / "config.json"
+        else:
+            config_path = Path(hf_hub_download(model_id, "1_Pooling/config.json"))
+        pooling_config = json.loads(config_path.read_text())
+    except Exception as e:
+        logger.warning(f"No pooling config found for {model_id}, using mean pooling: {str(e)}")
+        return "mean"
+    
+    for mode, key in POOLING_MODES.items():
+        if pooling_config.get(key):
+            return mode
+    return "mean"
+
 class EmbeddingService:
     """
     Service for generating embeddings using Groq API (primary) 
@@ -28,14 +77,72 @@ class EmbeddingService:
     def __init__(self):
         self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
         self.local_model = None
+        self.onnx_session = None
+        self.onnx_tokenizer = None
+        self.onnx_dimension = None
+        self.onnx_pooling = "mean"
+        self.use_gpu = False
         self.embedding_provider = settings.EMBEDDING_PROVIDER
         
         # Initialize local model if needed
         if self.embedding_provider == "local":
             self._init_local_model()
     
+    @property
+    def active_backend(self) -> str:
+        """
+        Backend currently producing local embeddings: "onnx-int8", "torch-fp16"
+        (GPU), "torch", or "hash" for the fallback. Reports what is loaded and
+        never loads a model itself.
+        """
+        if self.onnx_session is not None:
+            return "onnx-int8"
+        if self.local_model is not None:
+            return "torch-fp16" if self.use_gpu else "torch"
+        return "hash"
+    
+    @property
+    def embedding_signature(self) -> str:
+        """
+        Identifies the embedding space vectors come from; vectors with different
+        signatures are not comparable
+        """
+        backend = self.active_backend
+        model = "hash" if backend == "hash" else settings.LOCAL_EMBEDDING_MODEL
+        return f"{self.embedding_provider}:{model}:{backend}"
+    
+    def _use_onnx_backend(self) -> bool:
+        return settings.LOCAL_EMBEDDING_BACKEND == "onnx-int8" and ONNX_RUNTIME_AVAILABLE
+    
+    def _has_local_model(self) -> bool:
+        """Load the local model on first use; True if one is available"""
+        if self.local_model is None and self.onnx_session is None:
+            if self._use_onnx_backend() or SENTENCE_TRANSFORMERS_AVAILABLE:
+                self._init_local_model()
+        return self.local_model is not None or self.onnx_session is not None
+    
     def _init_local_model(self):
         """Initialize local sentence transformer model"""
+        if SENTENCE_TRANSFORMERS_AVAILABLE and torch.cuda.is_available():
+            try:
+                torch.set_float32_matmul_precision("high")
+                logger.info(f"Loading local embedding model on GPU (FP16): {settings.LOCAL_EMBEDDING_MODEL}")
+                self.local_model = SentenceTransformer(settings.LOCAL_EMBEDDING_MODEL, device="cuda").half().eval()
+                self.use_gpu = True
+                return
+            except Exception as e:
+                logger.error(f"Failed to load embedding model on GPU, using CPU: {str(e)}")
+                self.local_model = None
+                self.use_gpu = False
+        
+        if self._use_onnx_backend():
+            try:
+                self._init_onnx_model()
+                return
+            except Exception as e:
+                logger.error(f"Failed to load ONNX INT8 embedding model, using sentence-transformers: {str(e)}")
+                self.onnx_session = None
+        
         try:
             if not SENTENCE_TRANSFORMERS_AVAILABLE:
                 logger.warning("sentence-transformers not available, using simple hash-based embeddings")
@@ -49,6 +156,127 @@ class EmbeddingService:
             logger.error(f"Failed to load local embedding model: {str(e)}")
             self.local_model = None
     
+    def _init_onnx_model(self):
+        """
+        Export the local model to ONNX, apply dynamic INT8 quantization once,
+        and open a CPU inference session over the quantized graph.
+        Exports live in a directory named after the model, so changing
+        LOCAL_EMBEDDING_MODEL exports a new graph instead of reusing the old one.
+        """
+        model_id = settings.LOCAL_EMBEDDING_MODEL
+        model_dir = Path(settings.ONNX_MODEL_DIR) / model_id.strip("/").replace("/", "--")
+        quantized_path = model_dir / "model_quantized.onnx"
+        pooling_path = model_dir / "pooling.json"
+        
+        if not quantized_path.exists():
+            logger.info(f"Exporting {model_id} to ONNX with INT8 quantization")
+            model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+            model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_id).save_pretrained(model_dir)
+            
+            quantizer = ORTQuantizer.from_pretrained(model_dir)
+            quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=model_dir, quantization_config=quantization_config)
+        
+        # The exported graph stops at token embeddings; pool them the way the model does
+        if not pooling_path.exists():
+            pooling_path.write_text(json.dumps({"model": model_id, "mode": _read_pooling_mode(model_id)}))
+        self.onnx_pooling = json.loads(pooling_path.read_text())["mode"]
+        
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        
+        self.onnx_session = ort.InferenceSession(
+            str(quantized_path),
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.onnx_input_names = {model_input.name for model_input in self.onnx_session.get_inputs()}
+        self.onnx_tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        
+        # Embedding size from the graph's output shape, probing once if it is symbolic
+        hidden_size = self.onnx_session.get_outputs()[0].shape[-1]
+        if isinstance(hidden_size, int):
+            self.onnx_dimension = hidden_size
+        else:
+            self.onnx_dimension = int(self._encode_onnx(["dimension probe"]).shape[1])
+        logger.info(f"ONNX INT8 embedding model loaded successfully ({self.onnx_pooling} pooling)")
+    
+    def _encode_onnx(self, texts: List[str]):
+        """
+        Sentence embeddings from the ONNX session, pooled per the model's pooling
+        config and L2-normalized like every other backend's output
+        """
+        features = self.onnx_tokenizer(
+            texts, padding=True, truncation=True, pad_to_multiple_of=INT8_PAD_MULTIPLE, return_tensors="np"
+        )
+        inputs = {name: value for name, value in features.items() if name in self.onnx_input_names}
+        token_embeddings = self.onnx_session.run(None, inputs)[0]
+        
+        mask = features["attention_mask"][..., None].astype(np.float32)
+        if self.onnx_pooling == "cls":
+            pooled = token_embeddings[:, 0]
+        elif self.onnx_pooling == "max":
+            pooled = np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        else:
+            token_counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = (token_embeddings * mask).sum(axis=1)
+            pooled = pooled / (np.sqrt(token_counts) if self.onnx_pooling == "mean_sqrt_len" else token_counts)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    
+    def _encode_gpu(self, texts: List[str], batch_size: int = 32):
+        """Half-precision batched forward pass on the GPU"""
+        outputs = []
+        with torch.inference_mode(), torch.amp.autocast("cuda", dtype=torch.float16):
+            for i in range(0, len(texts), batch_size):
+                features = self._pad_features(self.local_model.tokenize(texts[i:i + batch_size]))
+                features = {name: value.to("cuda", non_blocking=True) for name, value in features.items()}
+                embeddings = self.local_model(features)["sentence_embedding"]
+                outputs.append(F.normalize(embeddings.float(), p=2, dim=1).cpu().numpy())
+        return np.concatenate(outputs)
+    
+    def _pad_features(self, features: dict, multiple: int = FP16_PAD_MULTIPLE) -> dict:
+        """Right-pad tokenized sentence-transformers features to a multiple of the sequence length"""
+        seq_len = features["input_ids"].shape[1]
+        extra = -seq_len % multiple
+        if not extra:
+            return features
+        
+        pad_token_id = self.local_model.tokenizer.pad_token_id or 0
+        return {
+            name: F.pad(value, (0, extra), value=pad_token_id if name == "input_ids" else 0)
+            if torch.is_tensor(value) and value.dim() == 2 and value.shape[1] == seq_len else value
+            for name, value in features.items()
+        }
+    
+    def _encode_local(self, texts: List[str], batch_size: int = 32):
+        """Encode texts with whichever local backend is loaded"""
+        if not self.use_gpu and self.onnx_session is None:
+            # sentence-transformers already sorts each call by length internally
+            return self.local_model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        
+        # Batch similar-length texts together to minimize padding, then restore input order
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+        
+        if self.use_gpu:
+            embeddings = self._encode_gpu(sorted_texts, batch_size)
+        else:
+            embeddings = np.concatenate([
+                self._encode_onnx(sorted_texts[i:i + batch_size])
+                for i in range(0, len(sorted_texts), batch_size)
+            ])
+        
+        return embeddings[np.argsort(order)]
+    
+    async def warmup(self):
+        """
+        Load the local model and run one embedding, so the first real
+        call doesn't pay for model loading and first-batch setup
+        """
+        await asyncio.to_thread(self._has_local_model)
+        await self.embed_texts(["warmup"])
+    
     async def embed_text(self, text: str) -> List[float]:
         """
         Generate embedding for a single text
@@ -66,15 +294,33 @@ class EmbeddingService:
             else:
                 return await self._embed_with_groq(text)
     
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    async def embed_texts(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         """
-        Generate embeddings for multiple texts
+        Generate embeddings for multiple texts as a float32 array of shape (N, D).
+        Uses a single batched model call when the local model is available.
         """
-        embeddings = []
-        for text in texts:
-            embedding = await self.embed_text(text)
-            embeddings.append(embedding)
-        return embeddings
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        if self._has_local_model():
+            try:
+                loop = asyncio.get_event_loop()
+                embeddings = await loop.run_in_executor(
+                    None,
+                    functools.partial(self._encode_local, texts, batch_size=batch_size)
+                )
+                return np.asarray(embeddings, dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Batched embedding failed, embedding texts one by one: {str(e)}")
+        
+        # Without a local model, overlap the per-text calls with bounded concurrency
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+        
+        async def _embed_one(text: str) -> List[float]:
+            async with semaphore:
+                return await self.embed_text(text)
+        
+        return np.asarray(await asyncio.gather(*[_embed_one(text) for text in texts]), dtype=np.float32)
     
     async def _embed_with_groq(self, text: str) -> List[float]:
         """
@@ -103,23 +349,17 @@ class EmbeddingService:
         Generate embedding using local sentence transformer or simple hash fallback
         """
         try:
-            if self.local_model is None and SENTENCE_TRANSFORMERS_AVAILABLE:
-                self._init_local_model()
-            
-            if self.local_model is not None:
-                # Use sentence transformers if available
+            if self._has_local_model():
+                # Use the local model (ONNX INT8 or sentence transformers) if available
                 loop = asyncio.get_event_loop()
-                embedding = await loop.run_in_executor(
+                embeddings = await loop.run_in_executor(
                     None, 
-                    self.local_model.encode, 
-                    text
+                    self._encode_local, 
+                    [text]
                 )
                 
                 # Convert numpy array to list
-                if isinstance(embedding, np.ndarray):
-                    embedding = embedding.tolist()
-                
-                return embedding
+                return embeddings[0].tolist()
             else:
                 # Fallback to simple hash-based embedding
                 logger.info("Using simple hash-based embedding fallback")
@@ -150,7 +390,10 @@ class EmbeddingService:
                 else:
                     embeddings.append(0.0)
         
-        return embeddings[:dimension]
+        # L2-normalize so cosine distances line up with the model embeddings
+        embeddings = embeddings[:dimension]
+        norm = sum(value * value for value in embeddings) ** 0.5
+        return [value / norm for value in embeddings] if norm else embeddings
     
     def get_embedding_dimension(self) -> int:
         """
@@ -160,8 +403,15 @@ class EmbeddingService:
             # TODO: Return actual Groq embedding dimension
             return 384  # Placeholder, typically 1536 for OpenAI-style models
         else:
-            if self.local_model is None and SENTENCE_TRANSFORMERS_AVAILABLE:
-                self._init_local_model()
-            if self.local_model is not None:
+            if self._has_local_model():
+                if self.onnx_session is not None:
+                    return self.onnx_dimension
                 return self.local_model.get_sentence_embedding_dimension()
             return 384  # Default dimension for hash-based embeddings
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_service() -> EmbeddingService:
+    """
+    Shared embedding service, so the local model is loaded once per process
+    """
+    return EmbeddingService()
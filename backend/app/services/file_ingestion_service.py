@@ -1,40 +1,128 @@
 import os
-import tempfile
+import re
 import shutil
-from typing import List, Dict, Any, Tuple
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Set
+from dataclasses import dataclass, field, asdict
 import logging
 from pathlib import Path
 import asyncio
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import aiofiles
+import aiofiles.os
+import aiofiles.tempfile
 
-from app.services.document_processor import DocumentProcessor
+from app.services.document_processor import process_file_sync
 from app.services.chunking_service import ChunkingService
-from app.services.embedding_service import EmbeddingService
-from app.services.vectorstore_service import VectorStoreService
+from app.services.embedding_service import get_embedding_service
+from app.services.vectorstore_service import get_vectorstore_service
 from app.core.constants import ALL_SUPPORTED_EXTENSIONS
 
 logger = logging.getLogger(__name__)
 
+@dataclass(slots=True)
+class ProcessingStats:
+    """Counters for a single ingestion run"""
+    files_processed: int = 0
+    files_failed: int = 0
+    chunks_created: int = 0
+    total_size_bytes: int = 0
+    processing_time_seconds: float = 0.0
+    failed_files: List[str] = field(default_factory=list)
+    duplicate_chunks_skipped: int = 0
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+def compute_simhash(text: str) -> int:
+    """Compute a 64-bit SimHash fingerprint of the text's word tokens"""
+    weights = [0] * 64
+    for token, count in Counter(_TOKEN_PATTERN.findall(text.lower())).items():
+        token_hash = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            if token_hash >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup over 64-bit SimHash fingerprints.
+    Fingerprints are bucketed by four 16-bit bands, so any two hashes within
+    a Hamming distance of 3 are guaranteed to share at least one bucket.
+    """
+    
+    BANDS = 4
+    BAND_BITS = 16
+    
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.buckets: List[Dict[int, Set[int]]] = [{} for _ in range(self.BANDS)]
+    
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.BAND_BITS) - 1
+        for band in range(self.BANDS):
+            yield band, (fingerprint >> (band * self.BAND_BITS)) & mask
+    
+    def add(self, fingerprint: int):
+        for band, key in self._band_keys(fingerprint):
+            self.buckets[band].setdefault(key, set()).add(fingerprint)
+    
+    def is_near_duplicate(self, fingerprint: int) -> bool:
+        for band, key in self._band_keys(fingerprint):
+            for candidate in self.buckets[band].get(key, ()):
+                if bin(candidate ^ fingerprint).count('1') <= self.max_distance:
+                    return True
+        return False
+
+# Upper bound on parsing workers; cpu_count() reports host cores inside containers
+MAX_PARSE_WORKERS = 4
+
+# Worker processes for CPU-bound document parsing, shared by every service instance
+_parse_pool = None
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Create the parsing process pool on first use; it is shut down at interpreter exit.
+    Workers are spawned rather than forked, since the server process already runs
+    thread pools and native libraries that are unsafe to fork.
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        available_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=max(1, min(available_cpus or 1, MAX_PARSE_WORKERS)),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        atexit.register(_parse_pool.shutdown)
+    return _parse_pool
+
 class FileIngestionService:
     """
     Service for handling file uploads and processing them through the RAG pipeline
     """
     
     def __init__(self):
-        self.document_processor = DocumentProcessor()
         self.chunking_service = ChunkingService()
-        self.embedding_service = EmbeddingService()
-        self.vectorstore_service = VectorStoreService()
+        self.embedding_service = get_embedding_service()
+        self.vectorstore_service = get_vectorstore_service()
+        
+        # SimHash index of stored chunks, loaded lazily from vector store metadata
+        # and reloaded whenever documents were removed from the store
+        self._simhash_index = None
+        self._simhash_generation = None
         
         # Processing statistics
-        self.processing_stats = {
-            'files_processed': 0,
-            'files_failed': 0,
-            'chunks_created': 0,
-            'total_size_bytes': 0,
-            'processing_time_seconds': 0,
-            'failed_files': []
-        }
+        self.processing_stats = ProcessingStats()
     
     async def process_uploaded_files(
         self, 
@@ -46,7 +134,7 @@ class FileIngestionService:
         
         Args:
             uploaded_files: List of file dictionaries with 'name', 'content', 'size'
-            progress_callback: Optional callback for progress updates
+            progress_callback: Optional callback for progress updates (sync or async)
             
         Returns:
             Processing results and statistics
@@ -54,14 +142,7 @@ class FileIngestionService:
         start_time = datetime.utcnow()
         
         # Reset statistics
-        self.processing_stats = {
-            'files_processed': 0,
-            'files_failed': 0,
-            'chunks_created': 0,
-            'total_size_bytes': 0,
-            'processing_time_seconds': 0,
-            'failed_files': []
-        }
+        self.processing_stats = ProcessingStats()
         
         logger.info(f"Starting processing of {len(uploaded_files)} files")
         
@@ -71,7 +152,7 @@ class FileIngestionService:
             
             if invalid_files:
                 logger.warning(f"Found {len(invalid_files)} invalid files")
-                self.processing_stats['failed_files'].extend(invalid_files)
+                self.processing_stats.failed_files.extend(invalid_files)
             
             if not valid_files:
                 return self._build_result_summary(start_time, "No valid files to process")
@@ -88,8 +169,8 @@ class FileIngestionService:
                 logger.info(f"Processing batch {batch_num}/{total_batches}")
                 
                 if progress_callback:
-                    progress_callback(f"Processing batch {batch_num}/{total_batches}", 
-                                    (i / len(valid_files)) * 0.8)  # 80% for processing
+                    await self._report_progress(progress_callback, f"Processing batch {batch_num}/{total_batches}", 
+                                                (i / len(valid_files)) * 0.8)  # 80% for processing
                 
                 batch_chunks = await self._process_file_batch(batch)
                 all_chunks.extend(batch_chunks)
@@ -97,18 +178,18 @@ class FileIngestionService:
             # Generate embeddings and store in vector database
             if all_chunks:
                 if progress_callback:
-                    progress_callback("Generating embeddings...", 0.8)
+                    await self._report_progress(progress_callback, "Generating embeddings...", 0.8)
                 
                 await self._store_chunks_in_vectordb(all_chunks, progress_callback)
             
             # Calculate final statistics
             end_time = datetime.utcnow()
-            self.processing_stats['processing_time_seconds'] = (end_time - start_time).total_seconds()
+            self.processing_stats.processing_time_seconds = (end_time - start_time).total_seconds()
             
             logger.info(f"Processing completed: {self.processing_stats}")
             
             if progress_callback:
-                progress_callback("Processing complete!", 1.0)
+                await self._report_progress(progress_callback, "Processing complete!", 1.0)
             
             return self._build_result_summary(start_time, "Success")
             
@@ -116,6 +197,12 @@ class FileIngestionService:
             logger.error(f"Error in file processing: {str(e)}")
             return self._build_result_summary(start_time, f"Error: {str(e)}")
     
+    async def _report_progress(self, progress_callback, message: str, progress: float):
+        """Invoke the progress callback, awaiting it when it is a coroutine function"""
+        result = progress_callback(message, progress)
+        if asyncio.iscoroutine(result):
+            await result
+    
     def _validate_files(self, uploaded_files: List[Dict]) -> Tuple[List[Dict], List[str]]:
         """Validate uploaded files and return valid/invalid lists"""
         valid_files = []
@@ -147,65 +234,81 @@ class FileIngestionService:
                 continue
             
             valid_files.append(file_info)
-            self.processing_stats['total_size_bytes'] += file_size
+            self.processing_stats.total_size_bytes += file_size
         
         return valid_files, invalid_files
     
     async def _process_file_batch(self, file_batch: List[Dict]) -> List[Dict]:
-        """Process a batch of files and return chunks"""
+        """Process a batch of files concurrently and return chunks"""
+        results = await asyncio.gather(
+            *(self._process_single_file(file_info) for file_info in file_batch)
+        )
+        
         batch_chunks = []
+        for chunks in results:
+            batch_chunks.extend(chunks)
         
-        for file_info in file_batch:
+        return batch_chunks
+    
+    async def _process_single_file(self, file_info: Dict) -> List[Dict]:
+        """Parse and chunk one uploaded file; parsing runs in the process pool"""
+        filename = file_info.get('name', 'unknown')
+        
+        try:
+            content = file_info['content']
+            
+            logger.info(f"Processing file: {filename}")
+            
+            # Create temporary file for processing (async write keeps the event loop free)
+            async with aiofiles.tempfile.NamedTemporaryFile(mode='w', suffix=Path(filename).suffix, 
+                                                           delete=False, encoding='utf-8') as temp_file:
+                await temp_file.write(content)
+                temp_file_path = temp_file.name
+            
             try:
-                filename = file_info['name']
-                content = file_info['content']
+                # Parse in a worker process so CPU-bound extraction (PDF/DOCX) uses all cores
+                loop = asyncio.get_running_loop()
+                processed_content, metadata = await loop.run_in_executor(
+                    _get_parse_pool(), process_file_sync, temp_file_path, filename
+                )
                 
-                logger.info(f"Processing file: {filename}")
+                # Add upload metadata
+                metadata.update({
+                    'upload_timestamp': datetime.utcnow().isoformat(),
+                    'file_size': len(content),
+                    'source': 'upload'
+                })
                 
-                # Create temporary file for processing
-                with tempfile.NamedTemporaryFile(mode='w', suffix=Path(filename).suffix, 
-                                               delete=False, encoding='utf-8') as temp_file:
-                    temp_file.write(content)
-                    temp_file_path = temp_file.name
+                # Chunk the content
+                chunks = await self.chunking_service.chunk_document(processed_content, metadata)
                 
-                try:
-                    # Process through document processor
-                    processed_content, metadata = await self.document_processor.process_file(
-                        temp_file_path, filename
-                    )
-                    
-                    # Add upload metadata
-                    metadata.update({
-                        'upload_timestamp': datetime.utcnow().isoformat(),
-                        'file_size': len(content),
-                        'source': 'upload'
-                    })
-                    
-                    # Chunk the content
-                    chunks = await self.chunking_service.chunk_document(processed_content, metadata)
-                    
-                    batch_chunks.extend(chunks)
-                    self.processing_stats['files_processed'] += 1
-                    self.processing_stats['chunks_created'] += len(chunks)
-                    
-                    logger.info(f"Successfully processed {filename}: {len(chunks)} chunks")
-                    
-                finally:
-                    # Clean up temporary file
-                    if os.path.exists(temp_file_path):
-                        os.unlink(temp_file_path)
+                self.processing_stats.files_processed += 1
+                self.processing_stats.chunks_created += len(chunks)
                 
-            except Exception as e:
-                error_msg = f"{filename}: {str(e)}"
-                logger.error(f"Error processing file: {error_msg}")
-                self.processing_stats['failed_files'].append(error_msg)
-                self.processing_stats['files_failed'] += 1
-        
-        return batch_chunks
+                logger.info(f"Successfully processed {filename}: {len(chunks)} chunks")
+                return chunks
+                
+            finally:
+                # Clean up temporary file
+                if await aiofiles.os.path.exists(temp_file_path):
+                    await aiofiles.os.remove(temp_file_path)
+            
+        except Exception as e:
+            error_msg = f"{filename}: {str(e)}"
+            logger.error(f"Error processing file: {error_msg}")
+            self.processing_stats.failed_files.append(error_msg)
+            self.processing_stats.files_failed += 1
+            return []
     
     async def _store_chunks_in_vectordb(self, chunks: List[Dict], progress_callback=None):
         """Store chunks in vector database with embeddings"""
         
+        # Skip chunks that are near-duplicates of stored (or earlier) chunks
+        chunks = await self._filter_duplicate_chunks(chunks)
+        if not chunks:
+            logger.info("All chunks were duplicates of existing content, nothing to store")
+            return
+        
         # Process in smaller batches for embedding generation
         embedding_batch_size = 10
         
@@ -214,7 +317,7 @@ class FileIngestionService:
             
             if progress_callback:
                 progress = 0.8 + (i / len(chunks)) * 0.2  # 80-100% range
-                progress_callback(f"Generating embeddings ({i+1}/{len(chunks)})", progress)
+                await self._report_progress(progress_callback, f"Generating embeddings ({i+1}/{len(chunks)})", progress)
             
             # Extract content and metadata
             documents = [chunk['content'] for chunk in batch]
@@ -230,8 +333,43 @@ class FileIngestionService:
                 embeddings=embeddings
             )
             
+            # Only fingerprints of stored chunks count as duplicates later on
+            for metadata in metadatas:
+                self._simhash_index.add(int(metadata['simhash'], 16))
+            
             logger.info(f"Stored batch {i//embedding_batch_size + 1} in vector database")
     
+    async def _filter_duplicate_chunks(self, chunks: List[Dict]) -> List[Dict]:
+        """
+        Drop near-duplicate chunks before they reach the embedding step.
+        Fingerprints of kept chunks join the stored index only once the chunks
+        are written, so a failed run does not mark its content as seen.
+        """
+        generation = self.vectorstore_service.generation
+        if self._simhash_index is None or self._simhash_generation != generation:
+            self._simhash_index = SimHashIndex()
+            self._simhash_generation = generation
+            for stored_hash in await self.vectorstore_service.get_metadata_values('simhash'):
+                self._simhash_index.add(int(stored_hash, 16))
+        
+        # Duplicates within this run are caught by a separate, throwaway index
+        pending_index = SimHashIndex()
+        unique_chunks = []
+        for chunk in chunks:
+            fingerprint = compute_simhash(chunk['content'])
+            if self._simhash_index.is_near_duplicate(fingerprint) or pending_index.is_near_duplicate(fingerprint):
+                self.processing_stats.duplicate_chunks_skipped += 1
+                continue
+            
+            pending_index.add(fingerprint)
+            chunk['metadata']['simhash'] = f"{fingerprint:016x}"
+            unique_chunks.append(chunk)
+        
+        if len(unique_chunks) < len(chunks):
+            logger.info(f"Skipped {len(chunks) - len(unique_chunks)} near-duplicate chunks")
+        
+        return unique_chunks
+    
     def _build_result_summary(self, start_time: datetime, status: str) -> Dict[str, Any]:
         """Build processing result summary"""
         end_time = datetime.utcnow()
@@ -239,12 +377,14 @@ class FileIngestionService:
         
         return {
             'status': status,
-            'files_processed': self.processing_stats['files_processed'],
-            'files_failed': self.processing_stats['files_failed'],
-            'chunks_created': self.processing_stats['chunks_created'],
-            'total_size_mb': round(self.processing_stats['total_size_bytes'] / 1024 / 1024, 2),
+            'files_processed': self.processing_stats.files_processed,
+            'files_failed': self.processing_stats.files_failed,
+            'chunks_created': self.processing_stats.chunks_created,
+            'total_size_mb': round(self.processing_stats.total_size_bytes / 1024 / 1024, 2),
             'processing_time_seconds': round(processing_time, 2),
-            'failed_files': self.processing_stats['failed_files'],
+            # Snapshot failures so callers never share the live list reset by the next run
+            'failed_files': tuple(self.processing_stats.failed_files),
+            'duplicate_chunks_skipped': self.processing_stats.duplicate_chunks_skipped,
             'timestamp': end_time.isoformat()
         }
     
@@ -255,7 +395,7 @@ class FileIngestionService:
         return {
             'total_chunks': vectorstore_stats.get('total_chunks', 0),
             'file_types': vectorstore_stats.get('file_types', {}),
-            'last_processing_stats': self.processing_stats,
+            'last_processing_stats': asdict(self.processing_stats),
             'supported_extensions': ALL_SUPPORTED_EXTENSIONS,
             'max_file_size_mb': 50
         }
@@ -265,15 +405,9 @@ class FileIngestionService:
         try:
             deleted_count = await self.vectorstore_service.clear_collection()
             
-            # Reset processing stats
-            self.processing_stats = {
-                'files_processed': 0,
-                'files_failed': 0,
-                'chunks_created': 0,
-                'total_size_bytes': 0,
-                'processing_time_seconds': 0,
-                'failed_files': []
-            }
+            # Reset processing stats and the dedup index
+            self.processing_stats = ProcessingStats()
+            self._simhash_index = None
             
             return {
                 'status': 'success',
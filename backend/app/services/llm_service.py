@@ -7,6 +7,13 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Built once and shared by every general chat request
+_GENERAL_CHAT_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful AI assistant. Engage in natural conversation, answer questions accurately, and provide thoughtful responses. Be concise but thorough."
+}
+_GENERAL_CHAT_HISTORY_LIMIT = 10
+
 class LLMService:
     """
     Service for interacting with Groq LLM API
@@ -89,17 +96,14 @@ class LLMService:
         """
         Format messages for general chat mode
         """
-        messages = [
-            {"role": "system", "content": "You are a helpful AI assistant. Engage in natural conversation, answer questions accurately, and provide thoughtful responses. Be concise but thorough."}
-        ]
+        messages = [_GENERAL_CHAT_SYSTEM_MESSAGE]
         
-        # Add conversation history
+        # Add conversation history (last 10 messages); stream_chat_completion
+        # projects each message down to role/content, so no copy is needed here
         if conversation_history:
-            for msg in conversation_history[-10:]:  # Last 10 messages
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+            if len(conversation_history) > _GENERAL_CHAT_HISTORY_LIMIT:
+                conversation_history = conversation_history[-_GENERAL_CHAT_HISTORY_LIMIT:]
+            messages.extend(conversation_history)
         
         # Add current user message
         messages.append({
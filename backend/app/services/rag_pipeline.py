@@ -1,19 +1,82 @@
-from typing import List, Dict, AsyncGenerator
+from pathlib import Path
+from typing import List, Dict, AsyncGenerator, Optional, Union
+import functools
+import hashlib
+import io
+import itertools
 import logging
+import re
 
+import numpy as np
+
+from app.config import settings
+from app.core.cache import LRUCache
 from app.services.llm_service import LLMService
-from app.services.embedding_service import EmbeddingService
-from app.services.vectorstore_service import VectorStoreService
-from app.core.prompts import build_rag_prompt, CODE_ASSISTANT_SYSTEM_PROMPT
-from app.core.code_prompts import (
-    build_code_generation_prompt, 
-    build_debugging_prompt, 
-    build_architecture_prompt,
-    build_code_review_prompt
-)
+from app.services.embedding_service import get_embedding_service
+from app.services.vectorstore_service import get_vectorstore_service
+from app.services.chunking_service import ChunkingService
+from app.core.code_prompts import build_code_assistant_messages, detect_generation_task
 
 logger = logging.getLogger(__name__)
 
+# Separator line framing each chunk in the formatted context
+_SEP = "=" * 50 + "\n"
+
+# Block size used when counting rows of CSV files streamed from disk
+CSV_READ_BLOCK_SIZE = 1 << 20
+
+# Queries about tabular data only need CSV chunks, so retrieval is prefiltered
+DATA_QUERY_KEYWORDS = ["csv", "dataset", "data set", "spreadsheet", "statistics", "average"]
+
+# Query categories in precedence order, each compiled once into a single pattern
+QUERY_CATEGORY_KEYWORDS = [
+    ("debugging", [
+        "error", "bug", "issue", "problem", "fix", "debug", 
+        "exception", "traceback", "fails", "broken", "not working"
+    ]),
+    ("architecture", [
+        "architecture", "design", "pattern", "structure", "organize",
+        "scalable", "performance", "optimize", "refactor", "improve"
+    ]),
+    ("review", [
+        "review", "check", "validate", "best practice", "code quality",
+        "security", "vulnerability", "clean up"
+    ]),
+]
+QUERY_CATEGORY_PRECEDENCE = {category: rank for rank, (category, _) in enumerate(QUERY_CATEGORY_KEYWORDS)}
+# One pattern for every keyword, scanned in a single pass. The lookahead lets
+# overlapping keywords match, and alternatives are listed in precedence order
+# so a higher-precedence keyword wins when several start at the same position.
+QUERY_CATEGORY_PATTERN = re.compile("(?=(?:" + "|".join(
+    f"(?P<{category}>{'|'.join(map(re.escape, words))})"
+    for category, words in QUERY_CATEGORY_KEYWORDS
+) + "))")
+
+def _first_n_lines(text: str, n: int) -> List[str]:
+    """Return the first n lines of text without splitting the rest of it"""
+    lines, start = [], 0
+    for _ in range(n):
+        newline = text.find('\n', start)
+        if newline < 0:
+            lines.append(text[start:])
+            break
+        lines.append(text[start:newline])
+        start = newline + 1
+    return lines
+
+@functools.lru_cache(maxsize=1024)
+def classify_query(query_lower: str) -> str:
+    """Return the prompt category for a lower-cased query"""
+    best_rank = len(QUERY_CATEGORY_KEYWORDS)
+    for match in QUERY_CATEGORY_PATTERN.finditer(query_lower):
+        best_rank = min(best_rank, QUERY_CATEGORY_PRECEDENCE[match.lastgroup])
+        if best_rank == 0:
+            break
+    
+    if best_rank < len(QUERY_CATEGORY_KEYWORDS):
+        return QUERY_CATEGORY_KEYWORDS[best_rank][0]
+    return "generation"
+
 class RAGPipeline:
     """
     Custom RAG pipeline without any framework.
@@ -22,8 +85,12 @@ class RAGPipeline:
     
     def __init__(self):
         self.llm_service = LLMService()
-        self.embedding_service = EmbeddingService()
-        self.vectorstore_service = VectorStoreService()
+        self.embedding_service = get_embedding_service()
+        self.vectorstore_service = get_vectorstore_service()
+        self.chunking_service = ChunkingService()
+        
+        # Query embeddings keyed by a digest of the query text
+        self._embed_cache = LRUCache(maxsize=1024)
     
     async def process_query(
         self, 
@@ -42,25 +109,35 @@ class RAGPipeline:
         try:
             # Step 1: Embed the user query
             logger.info(f"Embedding query for session {session_id}")
-            query_embedding = await self.embedding_service.embed_text(query)
+            query_embedding = await self._embed_query(query)
             
-            # Step 2: Retrieve top-k similar chunks from ChromaDB
-            logger.info(f"Retrieving {top_k} similar chunks")
+            # Step 2: Retrieve similar chunks from ChromaDB, prefiltered by query category
+            # and over-fetched so weak matches can be dropped by distance
+            where_filter = self._build_retrieval_filter(query)
+            n_results = max(top_k, settings.RETRIEVAL_OVERFETCH)
+            logger.info(f"Retrieving up to {n_results} similar chunks (filter: {where_filter})")
             results = await self.vectorstore_service.query_similar(
                 query_embedding=query_embedding,
-                n_results=top_k
+                n_results=n_results,
+                where_filter=where_filter
             )
             
+            if where_filter and not results['documents']:
+                results = await self.vectorstore_service.query_similar(
+                    query_embedding=query_embedding,
+                    n_results=n_results
+                )
+            
+            results = self._select_relevant_results(results, top_k)
+            
             # Step 3: Format retrieved context
             context = self._format_context(results)
             
-            # Step 4: Determine query type and build appropriate prompt
-            prompt = self._build_intelligent_prompt(query, context, conversation_history)
+            # Step 4: Determine query type and build messages (static system prefix,
+            # then history, then retrieved context and the query)
+            messages = self._build_intelligent_prompt(query, context, conversation_history)
             
-            # Step 5: Format messages for LLM
-            messages = [{"role": "user", "content": prompt}]
-            
-            # Step 6: Stream response from LLM
+            # Step 5: Stream response from LLM
             logger.info("Streaming LLM response with enhanced prompt")
             async for token in self.llm_service.stream_chat_completion(messages):
                 yield token
@@ -69,84 +146,97 @@ class RAGPipeline:
             logger.error(f"RAG pipeline error: {str(e)}")
             yield f"Error in RAG pipeline: {str(e)}"
     
+    async def _embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the cached embedding for repeated queries"""
+        key = hashlib.blake2b(query.encode('utf-8'), digest_size=16).digest()
+        
+        embedding = self._embed_cache.get(key)
+        if embedding is None:
+            embedding = await self.embedding_service.embed_text(query)
+            self._embed_cache[key] = embedding
+        
+        return embedding
+    
+    def _build_retrieval_filter(self, query: str) -> Optional[Dict]:
+        """Chroma where filter narrowing the search to the query's document category"""
+        query_lower = query.lower()
+        
+        if any(word in query_lower for word in DATA_QUERY_KEYWORDS):
+            return {"file_type": ".csv"}
+        
+        return None
+    
+    def _select_relevant_results(self, results: Dict, top_k: int) -> Dict:
+        """
+        Keep at most top_k results closer than RETRIEVAL_MAX_DISTANCE.
+        If none pass the threshold, fall back to the top_k nearest.
+        """
+        distances = results['distances']
+        keep = np.flatnonzero(distances < settings.RETRIEVAL_MAX_DISTANCE)[:top_k]
+        
+        if not keep.size:
+            keep = np.arange(min(top_k, len(results['documents'])))
+        
+        return {
+            'documents': [results['documents'][i] for i in keep],
+            'metadatas': [results['metadatas'][i] for i in keep],
+            'distances': distances[keep],
+            'ids': [results['ids'][i] for i in keep]
+        }
+    
     def _build_intelligent_prompt(
         self, 
         query: str, 
         context: str, 
         conversation_history: List[Dict]
-    ) -> str:
+    ) -> List[Dict[str, str]]:
         """
-        Build intelligent prompt based on query type analysis
+        Build chat messages with a task-specific system prompt based on query type analysis
         """
-        query_lower = query.lower()
-        
-        # Detect debugging/error queries
-        if any(word in query_lower for word in [
-            "error", "bug", "issue", "problem", "fix", "debug", 
-            "exception", "traceback", "fails", "broken", "not working"
-        ]):
-            return build_debugging_prompt(context, query, conversation_history)
+        task = classify_query(query.lower())
         
-        # Detect architecture/design queries
-        elif any(word in query_lower for word in [
-            "architecture", "design", "pattern", "structure", "organize",
-            "scalable", "performance", "optimize", "refactor", "improve"
-        ]):
-            return build_architecture_prompt(context, query, conversation_history)
+        # Default to enhanced code generation, refined by the request wording
+        if task == "generation":
+            task = detect_generation_task(query)
         
-        # Detect code review queries
-        elif any(word in query_lower for word in [
-            "review", "check", "validate", "best practice", "code quality",
-            "security", "vulnerability", "clean up"
-        ]):
-            return build_code_review_prompt(context, query, conversation_history)
-        
-        # Default to enhanced code generation prompt
-        else:
-            return build_code_generation_prompt(context, query, conversation_history)
+        return build_code_assistant_messages(task, context, query, conversation_history)
     
     def _format_context(self, results: Dict) -> str:
         """Format retrieved chunks into readable context"""
         if not results['documents']:
             return "No relevant code context found in your project."
         
-        context_parts = []
+        buffer = io.StringIO()
+        similarities = 1.0 - np.asarray(results['distances'], dtype=np.float32)
         
-        for doc, metadata, distance in zip(
+        for i, (doc, metadata, similarity) in enumerate(zip(
             results['documents'], 
             results['metadatas'], 
-            results['distances']
-        ):
-            # Format each chunk with metadata
-            filename = metadata.get('filename', 'Unknown file')
-            file_type = metadata.get('file_type', 'unknown')
-            start_line = metadata.get('start_line', 'N/A')
-            end_line = metadata.get('end_line', 'N/A')
-            function_name = metadata.get('function_name', '')
-            class_name = metadata.get('class_name', '')
-            
-            # Build context header
-            header_parts = [f"File: {filename}"]
-            
-            if start_line != 'N/A' and end_line != 'N/A':
-                header_parts.append(f"Lines: {start_line}-{end_line}")
-            
-            if class_name:
-                header_parts.append(f"Class: {class_name}")
-            
-            if function_name:
-                header_parts.append(f"Function: {function_name}")
-            
-            header_parts.append(f"Similarity: {1-distance:.3f}")
-            
-            context_parts.append(
-                f"{'=' * 50}\n"
-                f"{' | '.join(header_parts)}\n"
-                f"{'=' * 50}\n"
-                f"{doc}\n"
-            )
+            similarities
+        )):
+            if i:
+                buffer.write("\n")
+            
+            # Format each chunk with a metadata header
+            buffer.write(_SEP)
+            buffer.write("File: ")
+            buffer.write(metadata.get('filename', 'Unknown file'))
+            
+            if (start_line := metadata.get('start_line')) is not None and (end_line := metadata.get('end_line')) is not None:
+                buffer.write(f" | Lines: {start_line}-{end_line}")
+            
+            if class_name := metadata.get('class_name'):
+                buffer.write(f" | Class: {class_name}")
+            
+            if function_name := metadata.get('function_name'):
+                buffer.write(f" | Function: {function_name}")
+            
+            buffer.write(f" | Similarity: {similarity:.3f}\n")
+            buffer.write(_SEP)
+            buffer.write(doc)
+            buffer.write("\n")
         
-        return "\n".join(context_parts)
+        return buffer.getvalue()
     
     async def get_pipeline_status(self) -> Dict:
         """Get status of RAG pipeline components"""
@@ -198,20 +288,21 @@ class RAGPipeline:
                 "message": f"Error clearing knowledge base: {str(e)}"
             }
     
-    async def add_document(self, doc_id: str, content: str, metadata: Dict) -> Dict:
-        """Add a document to the knowledge base"""
+    async def add_document(self, doc_id: str, content: Union[str, Path], metadata: Dict) -> Dict:
+        """
+        Add a document to the knowledge base.
+        CSV files can be passed as a path so they are streamed from disk.
+        """
         try:
             # Handle CSV files specially
             if metadata.get('file_type') == '.csv':
                 chunks = await self._process_csv_content(content, metadata)
             else:
-                from app.services.chunking_service import ChunkingService
-                
-                # Initialize chunking service
-                chunking_service = ChunkingService()
+                if isinstance(content, Path):
+                    content = content.read_text(encoding='utf-8')
                 
                 # Chunk the document
-                chunks = await chunking_service.chunk_document(
+                chunks = await self.chunking_service.chunk_document(
                     content=content,
                     metadata=metadata
                 )
@@ -224,23 +315,21 @@ class RAGPipeline:
                     "message": "No chunks generated from document"
                 }
             
-            # Process each chunk
-            chunks_added = 0
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{doc_id}_chunk_{i}"
-                
-                # Generate embedding
-                embedding = await self.embedding_service.embed_text(chunk['content'])
-                
-                # Add to vector store
-                await self.vectorstore_service.add_document(
-                    doc_id=chunk_id,
-                    content=chunk['content'],
-                    embedding=embedding,
-                    metadata={**metadata, **chunk.get('metadata', {})}
-                )
-                
-                chunks_added += 1
+            # Embed all chunks in one batched call and store them in one write
+            texts = [chunk['content'] for chunk in chunks]
+            metadatas = [{**metadata, **chunk.get('metadata', {})} for chunk in chunks]
+            ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
+            
+            embeddings = await self.embedding_service.embed_texts(texts, batch_size=32)
+            
+            await self.vectorstore_service.add_documents(
+                documents=texts,
+                metadatas=metadatas,
+                embeddings=embeddings,
+                ids=ids
+            )
+            
+            chunks_added = len(chunks)
             
             logger.info(f"Added {chunks_added} chunks for document {doc_id}")
             
@@ -258,35 +347,75 @@ class RAGPipeline:
                 "message": f"Error adding document: {str(e)}"
             }
     
-    async def _process_csv_content(self, content: str, metadata: Dict) -> List[Dict]:
-        """Process CSV content into chunks"""
+    def _read_csv_head(self, path: Path, max_lines: int):
+        """
+        Return the first max_lines lines of a CSV file and its total line count,
+        streaming the file in blocks instead of loading it into memory
+        """
+        with open(path, 'rb') as f:
+            head = [
+                line.decode('utf-8', errors='ignore').rstrip('\r\n')
+                for line in itertools.islice(f, max_lines)
+            ]
+            line_count = len(head)
+            last_byte = b'\n'
+            for block in iter(functools.partial(f.read, CSV_READ_BLOCK_SIZE), b''):
+                line_count += block.count(b'\n')
+                last_byte = block[-1:]
+            # A final line without a trailing newline wasn't counted above
+            if last_byte != b'\n' and line_count > len(head):
+                line_count += 1
+        
+        return head, line_count
+    
+    async def _process_csv_content(self, content: Union[str, Path], metadata: Dict) -> List[Dict]:
+        """Process CSV content (text, or a path streamed from disk) into chunks"""
         chunks = []
         
-        # Handle very large files by limiting content processing
-        if len(content) > 10_000_000:  # 10MB limit for full processing
-            return await self._process_large_csv_content(content, metadata)
+        if isinstance(content, Path):
+            file_size = content.stat().st_size
+            
+            # Handle very large files by only reading a preview from disk
+            if file_size > 10_000_000:  # 10MB limit for full processing
+                with open(content, 'rb') as f:
+                    preview = f.read(4096).decode('utf-8', errors='ignore')
+                return await self._process_large_csv_content(preview, metadata, file_size)
         
-        lines = content.strip().split('\n')
+        # Handle very large files by limiting content processing
+        elif len(content) > 10_000_000:  # 10MB limit for full processing
+            return await self._process_large_csv_content(content[:1000], metadata, len(content))
         
-        if not lines:
-            return chunks
+        else:
+            content = content.strip()
+            if not content:
+                return chunks
         
         filename = metadata.get('file_name', 'unknown.csv')
         
         try:
+            if isinstance(content, Path):
+                lines, line_count = self._read_csv_head(content, 21)
+                if not lines:
+                    return chunks
+            else:
+                # Count rows in C and slice out only the header and sample rows,
+                # instead of materializing every line as a Python string
+                line_count = content.count('\n') + 1
+                lines = _first_n_lines(content, 21)
+            
             # Get header row
-            header = lines[0] if lines else ""
+            header = lines[0]
             
             # For small CSV files (< 1000 rows), create summary chunks
-            if len(lines) <= 1000:
+            if line_count <= 1000:
                 # Create header chunk
                 columns_str = header if header else ""
                 chunks.append({
-                    'content': f"CSV File: {filename}\nColumns: {header}\nTotal Rows: {len(lines) - 1}",
+                    'content': f"CSV File: {filename}\nColumns: {header}\nTotal Rows: {line_count - 1}",
                     'metadata': {
                         **metadata,
                         'chunk_type': 'csv_header',
-                        'row_count': len(lines) - 1,
+                        'row_count': line_count - 1,
                         'columns_str': columns_str,
                         'column_count': len(header.split(',')) if header else 0
                     }
@@ -310,11 +439,11 @@ class RAGPipeline:
                 # Header chunk
                 columns_str = header if header else ""
                 chunks.append({
-                    'content': f"Large CSV File: {filename}\nColumns: {header}\nTotal Rows: {len(lines) - 1}",
+                    'content': f"Large CSV File: {filename}\nColumns: {header}\nTotal Rows: {line_count - 1}",
                     'metadata': {
                         **metadata,
                         'chunk_type': 'csv_header_large',
-                        'row_count': len(lines) - 1,
+                        'row_count': line_count - 1,
                         'columns_str': columns_str,
                         'column_count': len(header.split(',')) if header else 0
                     }
@@ -335,7 +464,7 @@ class RAGPipeline:
                 
                 # Create a statistical summary
                 stats_content = f"Statistics for {filename}:\n"
-                stats_content += f"- Total records: {len(lines) - 1:,}\n"
+                stats_content += f"- Total records: {line_count - 1:,}\n"
                 stats_content += f"- Columns: {len(header.split(',')) if header else 0}\n"
                 stats_content += f"- File size: {metadata.get('file_size', 0):,} bytes\n"
                 stats_content += f"- Data type: Large dataset suitable for analysis\n"
@@ -353,7 +482,7 @@ class RAGPipeline:
             logger.error(f"Error processing CSV {filename}: {str(e)}")
             # Fallback to simple text chunk
             chunks.append({
-                'content': f"CSV File: {filename}\nContent preview:\n{content[:1000]}...",
+                'content': f"CSV File: {filename}\nContent preview:\n{self._csv_preview(content)}...",
                 'metadata': {
                     **metadata,
                     'chunk_type': 'csv_fallback',
@@ -363,14 +492,19 @@ class RAGPipeline:
         
         return chunks
     
-    async def _process_large_csv_content(self, content: str, metadata: Dict) -> List[Dict]:
-        """Process very large CSV files with limited memory usage"""
+    def _csv_preview(self, content: Union[str, Path], size: int = 1000) -> str:
+        """First characters of a CSV, read from disk when given a path"""
+        if isinstance(content, Path):
+            with open(content, 'rb') as f:
+                return f.read(size).decode('utf-8', errors='ignore')
+        return content[:size]
+    
+    async def _process_large_csv_content(self, preview_content: str, metadata: Dict, file_size: int) -> List[Dict]:
+        """Process very large CSV files from a preview of their first bytes"""
         chunks = []
         filename = metadata.get('file_name', 'unknown.csv')
         
         try:
-            # Only read first 1000 characters to get header and sample
-            preview_content = content[:1000]
             lines = preview_content.split('\n')
             
             if not lines:
@@ -380,18 +514,18 @@ class RAGPipeline:
             columns_str = header if header else ""
             
             # Estimate total rows from file size (rough calculation)
-            estimated_rows = len(content) // 100  # Rough estimate
+            estimated_rows = file_size // 100  # Rough estimate
             
             # Create header chunk for large file
             chunks.append({
-                'content': f"Very Large CSV File: {filename}\nColumns: {header}\nEstimated Rows: ~{estimated_rows:,}\nFile Size: {len(content):,} bytes\nNote: This is a large dataset - only header and sample processed for performance.",
+                'content': f"Very Large CSV File: {filename}\nColumns: {header}\nEstimated Rows: ~{estimated_rows:,}\nFile Size: {file_size:,} bytes\nNote: This is a large dataset - only header and sample processed for performance.",
                 'metadata': {
                     **metadata,
                     'chunk_type': 'csv_header_very_large',
                     'estimated_rows': estimated_rows,
                     'columns_str': columns_str,
                     'column_count': len(header.split(',')) if header else 0,
-                    'file_size_bytes': len(content),
+                    'file_size_bytes': file_size,
                     'is_large_dataset': True
                 }
             })
@@ -416,12 +550,12 @@ class RAGPipeline:
             logger.error(f"Error processing large CSV {filename}: {str(e)}")
             # Fallback chunk
             chunks.append({
-                'content': f"Large CSV File: {filename}\nFile Size: {len(content):,} bytes\nProcessing limited due to size.",
+                'content': f"Large CSV File: {filename}\nFile Size: {file_size:,} bytes\nProcessing limited due to size.",
                 'metadata': {
                     **metadata,
                     'chunk_type': 'csv_large_fallback',
                     'processing_error': str(e),
-                    'file_size_bytes': len(content)
+                    'file_size_bytes': file_size
                 }
             })
         
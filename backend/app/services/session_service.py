@@ -1,57 +1,103 @@
-from typing import Dict, List, Optional
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+import functools
+import heapq
+import json
 import uuid
 from datetime import datetime, timedelta
 import logging
 
+from app.config import settings
+
+# Try to import the Redis client, but don't fail if not available
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    aioredis = None
+
+# Prefer orjson for (de)serializing stored messages when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# Keep only the most recent messages per session to prevent memory bloat
+MAX_HISTORY_MESSAGES = 50
+
+# Rebuild the activity heap once stale entries outnumber live sessions by this factor
+ACTIVITY_HEAP_COMPACT_FACTOR = 4
+
 class SessionService:
     """
     Service for managing user sessions and conversation history
-    In-memory storage for simplicity (can be replaced with Redis/DB)
+    In-memory storage, local to one worker process (see RedisSessionService)
     """
     
     def __init__(self):
         self.sessions: Dict[str, Dict] = {}
-        self.conversation_histories: Dict[str, List[Dict]] = {}
+        self.conversation_histories: Dict[str, Deque[Dict]] = {}
+        # Min-heap of (last_active, session_id); stale entries are skipped at cleanup
+        self._activity_heap: List[Tuple[datetime, str]] = []
     
-    def create_session(self, mode: str = "general") -> str:
+    async def create_session(self, mode: str = "general") -> str:
         """
         Create a new session and return session ID
         """
         session_id = str(uuid.uuid4())
+        now = datetime.utcnow()
         
         self.sessions[session_id] = {
             "session_id": session_id,
-            "created_at": datetime.utcnow(),
-            "last_active": datetime.utcnow(),
+            "created_at": now,
+            "last_active": now,
             "mode": mode
         }
+        self._push_activity(now, session_id)
         
-        self.conversation_histories[session_id] = []
+        self.conversation_histories[session_id] = deque(maxlen=MAX_HISTORY_MESSAGES)
         
         logger.info(f"Created new session: {session_id}")
         return session_id
     
-    def get_session(self, session_id: str) -> Optional[Dict]:
+    async def get_session(self, session_id: str) -> Optional[Dict]:
         """
         Get session information
         """
         return self.sessions.get(session_id)
     
-    def update_session_activity(self, session_id: str):
+    async def update_session_activity(self, session_id: str):
         """
         Update last active timestamp for session
         """
         if session_id in self.sessions:
-            self.sessions[session_id]["last_active"] = datetime.utcnow()
+            now = datetime.utcnow()
+            self.sessions[session_id]["last_active"] = now
+            self._push_activity(now, session_id)
     
-    def add_message_to_history(self, session_id: str, role: str, content: str):
+    def _push_activity(self, last_active: datetime, session_id: str):
+        """
+        Record session activity in the heap, rebuilding it from the live sessions
+        when superseded entries make it grow well past the session count
+        """
+        heapq.heappush(self._activity_heap, (last_active, session_id))
+        if len(self._activity_heap) > ACTIVITY_HEAP_COMPACT_FACTOR * (len(self.sessions) + 16):
+            self._activity_heap = [
+                (session["last_active"], sid) for sid, session in self.sessions.items()
+            ]
+            heapq.heapify(self._activity_heap)
+    
+    async def add_message_to_history(self, session_id: str, role: str, content: str):
         """
         Add a message to conversation history
         """
         if session_id not in self.conversation_histories:
-            self.conversation_histories[session_id] = []
+            self.conversation_histories[session_id] = deque(maxlen=MAX_HISTORY_MESSAGES)
         
         message = {
             "role": role,
@@ -60,55 +106,190 @@ class SessionService:
         }
         
         self.conversation_histories[session_id].append(message)
-        self.update_session_activity(session_id)
-        
-        # Keep only last 50 messages to prevent memory bloat
-        if len(self.conversation_histories[session_id]) > 50:
-            self.conversation_histories[session_id] = self.conversation_histories[session_id][-50:]
+        await self.update_session_activity(session_id)
     
-    def get_conversation_history(self, session_id: str) -> List[Dict]:
+    async def get_conversation_history(self, session_id: str) -> List[Dict]:
         """
         Get conversation history for a session
         """
-        return self.conversation_histories.get(session_id, [])
+        return list(self.conversation_histories.get(session_id, ()))
     
-    def clear_conversation_history(self, session_id: str) -> int:
+    async def clear_conversation_history(self, session_id: str) -> int:
         """
         Clear conversation history for a session
         Returns number of messages cleared
         """
         if session_id in self.conversation_histories:
             message_count = len(self.conversation_histories[session_id])
-            self.conversation_histories[session_id] = []
+            self.conversation_histories[session_id].clear()
             logger.info(f"Cleared {message_count} messages for session {session_id}")
             return message_count
         return 0
     
-    def cleanup_expired_sessions(self, timeout_minutes: int = 60):
+    async def cleanup_expired_sessions(self, timeout_minutes: int = 60):
         """
         Remove expired sessions (older than timeout_minutes)
         """
         cutoff_time = datetime.utcnow() - timedelta(minutes=timeout_minutes)
-        expired_sessions = []
+        expired_count = 0
         
-        for session_id, session_data in self.sessions.items():
-            if session_data["last_active"] < cutoff_time:
-                expired_sessions.append(session_id)
-        
-        for session_id in expired_sessions:
+        while self._activity_heap and self._activity_heap[0][0] < cutoff_time:
+            last_active, session_id = heapq.heappop(self._activity_heap)
+            
+            # Skip entries superseded by later activity or already removed
+            if self.sessions.get(session_id, {}).get("last_active") != last_active:
+                continue
+            
             del self.sessions[session_id]
-            if session_id in self.conversation_histories:
-                del self.conversation_histories[session_id]
+            self.conversation_histories.pop(session_id, None)
+            expired_count += 1
             logger.info(f"Cleaned up expired session: {session_id}")
         
-        return len(expired_sessions)
+        return expired_count
     
-    def get_or_create_session(self, session_id: Optional[str] = None, mode: str = "general") -> str:
+    async def get_or_create_session(self, session_id: Optional[str] = None, mode: str = "general") -> str:
         """
         Get existing session or create new one if not found
         """
         if session_id and session_id in self.sessions:
-            self.update_session_activity(session_id)
+            await self.update_session_activity(session_id)
+            return session_id
+        else:
+            return await self.create_session(mode)
+
+class RedisSessionService:
+    """
+    Session service backed by Redis so sessions are shared across workers.
+    Each session is a hash plus a capped message list, both expiring
+    after SESSION_TIMEOUT_MINUTES of inactivity.
+    """
+    
+    def __init__(self, redis_url: str):
+        self.redis = aioredis.from_url(redis_url, decode_responses=True)
+        self.ttl_seconds = settings.SESSION_TIMEOUT_MINUTES * 60
+    
+    @staticmethod
+    def _dumps(message: Dict) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(message)
+        return json.dumps(message).encode("utf-8")
+    
+    @staticmethod
+    def _session_key(session_id: str) -> str:
+        return f"sess:{session_id}"
+    
+    @staticmethod
+    def _history_key(session_id: str) -> str:
+        return f"hist:{session_id}"
+    
+    async def create_session(self, mode: str = "general") -> str:
+        """
+        Create a new session and return session ID
+        """
+        session_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(self._session_key(session_id), mapping={
+                "session_id": session_id,
+                "created_at": now,
+                "last_active": now,
+                "mode": mode
+            })
+            pipe.expire(self._session_key(session_id), self.ttl_seconds)
+            await pipe.execute()
+        
+        logger.info(f"Created new session: {session_id}")
+        return session_id
+    
+    async def get_session(self, session_id: str) -> Optional[Dict]:
+        """
+        Get session information
+        """
+        session = await self.redis.hgetall(self._session_key(session_id))
+        if not session:
+            return None
+        
+        session["created_at"] = datetime.fromisoformat(session["created_at"])
+        session["last_active"] = datetime.fromisoformat(session["last_active"])
+        return session
+    
+    async def update_session_activity(self, session_id: str):
+        """
+        Update last active timestamp and extend expiry for session
+        """
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(self._session_key(session_id), "last_active", datetime.utcnow().isoformat())
+            pipe.expire(self._session_key(session_id), self.ttl_seconds)
+            pipe.expire(self._history_key(session_id), self.ttl_seconds)
+            await pipe.execute()
+    
+    async def add_message_to_history(self, session_id: str, role: str, content: str):
+        """
+        Add a message to conversation history
+        """
+        message = {
+            "role": role,
+            "content": content,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        
+        # LTRIM keeps only the most recent messages, like the in-memory deque
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(self._history_key(session_id), self._dumps(message))
+            pipe.ltrim(self._history_key(session_id), -MAX_HISTORY_MESSAGES, -1)
+            pipe.hset(self._session_key(session_id), "last_active", message["timestamp"])
+            pipe.expire(self._history_key(session_id), self.ttl_seconds)
+            pipe.expire(self._session_key(session_id), self.ttl_seconds)
+            await pipe.execute()
+    
+    async def get_conversation_history(self, session_id: str) -> List[Dict]:
+        """
+        Get conversation history for a session
+        """
+        messages = await self.redis.lrange(self._history_key(session_id), 0, -1)
+        loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+        return [loads(message) for message in messages]
+    
+    async def clear_conversation_history(self, session_id: str) -> int:
+        """
+        Clear conversation history for a session
+        Returns number of messages cleared
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.llen(self._history_key(session_id))
+            pipe.delete(self._history_key(session_id))
+            message_count, _ = await pipe.execute()
+        
+        if message_count:
+            logger.info(f"Cleared {message_count} messages for session {session_id}")
+        return message_count
+    
+    async def cleanup_expired_sessions(self, timeout_minutes: int = 60):
+        """
+        No-op: Redis expires idle session keys on its own
+        """
+        return 0
+    
+    async def get_or_create_session(self, session_id: Optional[str] = None, mode: str = "general") -> str:
+        """
+        Get existing session or create new one if not found
+        """
+        if session_id and await self.redis.exists(self._session_key(session_id)):
+            await self.update_session_activity(session_id)
             return session_id
         else:
-            return self.create_session(mode)
+            return await self.create_session(mode)
+
+@functools.lru_cache(maxsize=None)
+def get_session_service():
+    """
+    Shared session service: Redis-backed when REDIS_URL is configured,
+    otherwise in-memory
+    """
+    if settings.REDIS_URL:
+        if REDIS_AVAILABLE:
+            logger.info("Using Redis session storage")
+            return RedisSessionService(settings.REDIS_URL)
+        logger.warning("REDIS_URL is set but redis is not installed, using in-memory sessions")
+    return SessionService()
@@ -1,14 +1,31 @@
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import functools
+import hashlib
+import json
 import logging
+import numpy as np
 import uuid
 from datetime import datetime
 
 from app.config import settings
+from app.core.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Collection settings: cosine space plus tuned HNSW graph parameters.
+# Embeddings are L2-normalized, so similarity = 1 - distance.
+COLLECTION_METADATA = {
+    "description": "Code Assistant RAG collection",
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64
+}
+
 class VectorStoreService:
     """
     Service for managing ChromaDB vector store operations
@@ -17,8 +34,20 @@ class VectorStoreService:
     def __init__(self):
         self.client = None
         self.collection = None
+        # Chroma calls are blocking; run them off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chroma")
+        # Recent query results; cleared on every write, TTL bounds staleness across instances
+        self._query_cache = TTLCache(maxsize=512, ttl=60)
+        # Bumped whenever stored documents are removed, so caches built from
+        # collection contents elsewhere know to reload
+        self.generation = 0
         self._initialize_client()
     
+    async def _run(self, func: Callable, *args, **kwargs):
+        """Run a blocking Chroma call in the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
     def _initialize_client(self):
         """Initialize ChromaDB client and collection"""
         try:
@@ -30,9 +59,17 @@ class VectorStoreService:
             # Get or create collection
             self.collection = self.client.get_or_create_collection(
                 name=settings.CHROMA_COLLECTION_NAME,
-                metadata={"description": "Code Assistant RAG collection"}
+                metadata=COLLECTION_METADATA
             )
             
+            # The distance space is fixed at creation; older collections keep theirs until cleared
+            existing_space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+            if existing_space != COLLECTION_METADATA["hnsw:space"]:
+                logger.warning(
+                    f"Collection {settings.CHROMA_COLLECTION_NAME} uses '{existing_space}' distance; "
+                    "clear the collection to rebuild it with cosine HNSW settings"
+                )
+            
             logger.info(f"ChromaDB initialized with collection: {settings.CHROMA_COLLECTION_NAME}")
             
         except Exception as e:
@@ -43,25 +80,31 @@ class VectorStoreService:
         self, 
         documents: List[str], 
         metadatas: List[Dict[str, Any]], 
-        embeddings: List[List[float]]
+        embeddings: Union[np.ndarray, List[List[float]]],
+        ids: Optional[List[str]] = None
     ) -> List[str]:
         """
         Add documents to the vector store
         Returns list of document IDs
         """
         try:
-            # Generate unique IDs for documents
-            ids = [str(uuid.uuid4()) for _ in documents]
+            # Generate unique IDs for documents unless stable IDs were given
+            if ids is None:
+                ids = [str(uuid.uuid4()) for _ in documents]
             
             # Add timestamp to metadata
             for metadata in metadatas:
                 metadata['added_at'] = datetime.utcnow().isoformat()
             
-            # Add to collection
-            self.collection.add(
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            
+            # Add to collection; Chroma only accepts nested lists
+            self._query_cache.clear()
+            await self._run(
+                self.collection.add,
                 documents=documents,
                 metadatas=metadatas,
-                embeddings=embeddings,
+                embeddings=vectors.tolist(),
                 ids=ids
             )
             
@@ -88,10 +131,12 @@ class VectorStoreService:
             metadata['added_at'] = datetime.utcnow().isoformat()
             
             # Add to collection
-            self.collection.add(
+            self._query_cache.clear()
+            await self._run(
+                self.collection.add,
                 ids=[doc_id],
                 documents=[content],
-                embeddings=[embedding],
+                embeddings=[list(embedding)],
                 metadatas=[metadata]
             )
             
@@ -109,41 +154,79 @@ class VectorStoreService:
         where_filter: Optional[Dict] = None
     ) -> Dict[str, Any]:
         """
-        Query for similar documents
+        Query for similar documents.
+        Distances are returned as a float32 numpy array.
         """
         try:
-            results = self.collection.query(
+            cache_key = self._query_cache_key(query_embedding, n_results, where_filter)
+            cached = self._query_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            
+            results = await self._run(
+                self.collection.query,
                 query_embeddings=[query_embedding],
                 n_results=n_results,
                 where=where_filter,
                 include=['documents', 'metadatas', 'distances']
             )
             
-            return {
+            # Single query: unwrap the one row of each result list
+            self._query_cache[cache_key] = output = {
                 'documents': results['documents'][0] if results['documents'] else [],
                 'metadatas': results['metadatas'][0] if results['metadatas'] else [],
-                'distances': results['distances'][0] if results['distances'] else [],
+                'distances': np.asarray(results['distances'][0] if results['distances'] else [], dtype=np.float32),
                 'ids': results['ids'][0] if results['ids'] else []
             }
+            return output
             
         except Exception as e:
             logger.error(f"Failed to query vector store: {str(e)}")
             return {
                 'documents': [],
                 'metadatas': [],
-                'distances': [],
+                'distances': np.empty(0, dtype=np.float32),
                 'ids': []
             }
     
+    def _query_cache_key(
+        self, 
+        query_embedding: List[float], 
+        n_results: int, 
+        where_filter: Optional[Dict]
+    ) -> Tuple[bytes, int, str]:
+        """
+        Cache key from the int8-quantized query embedding, so near-identical
+        embeddings share an entry, plus the result count and filter
+        """
+        codes = np.round(np.asarray(query_embedding, dtype=np.float32) * 127).astype(np.int8)
+        digest = hashlib.blake2b(codes.tobytes(), digest_size=16).digest()
+        return digest, n_results, json.dumps(where_filter, sort_keys=True)
+    
+    async def get_metadata_values(self, key: str) -> List[Any]:
+        """
+        Get every value stored under a metadata key across the collection
+        """
+        try:
+            results = await self._run(self.collection.get, include=['metadatas'])
+            return [
+                metadata[key] for metadata in results.get('metadatas') or []
+                if metadata and key in metadata
+            ]
+            
+        except Exception as e:
+            logger.error(f"Failed to get metadata values for {key}: {str(e)}")
+            return []
+    
     async def get_collection_stats(self) -> Dict[str, Any]:
         """
         Get statistics about the collection
         """
         try:
-            count = self.collection.count()
+            count = await self._run(self.collection.count)
             
             # Get sample of metadata to understand document types
-            sample_results = self.collection.get(limit=10, include=['metadatas'])
+            sample_results = await self._run(self.collection.get, limit=10, include=['metadatas'])
             
             file_types = {}
             for metadata in sample_results.get('metadatas', []):
@@ -171,15 +254,18 @@ class VectorStoreService:
         """
         try:
             # Get current count
-            count = self.collection.count()
+            count = await self._run(self.collection.count)
             
             # Delete the collection and recreate it
-            self.client.delete_collection(settings.CHROMA_COLLECTION_NAME)
+            self._query_cache.clear()
+            self.generation += 1
+            await self._run(self.client.delete_collection, settings.CHROMA_COLLECTION_NAME)
             
-            # Recreate collection
-            self.collection = self.client.get_or_create_collection(
+            # Recreate collection (this also migrates it to the current HNSW settings)
+            self.collection = await self._run(
+                self.client.get_or_create_collection,
                 name=settings.CHROMA_COLLECTION_NAME,
-                metadata={"description": "Code Assistant RAG collection"}
+                metadata=COLLECTION_METADATA
             )
             
             logger.info(f"Cleared {count} documents from vector store")
@@ -195,7 +281,8 @@ class VectorStoreService:
         """
         try:
             # First, get the IDs of documents to delete
-            results = self.collection.get(
+            results = await self._run(
+                self.collection.get,
                 where=where_filter,
                 include=['ids']
             )
@@ -203,7 +290,9 @@ class VectorStoreService:
             ids_to_delete = results.get('ids', [])
             
             if ids_to_delete:
-                self.collection.delete(ids=ids_to_delete)
+                self._query_cache.clear()
+                self.generation += 1
+                await self._run(self.collection.delete, ids=ids_to_delete)
                 logger.info(f"Deleted {len(ids_to_delete)} documents")
             
             return len(ids_to_delete)
@@ -223,3 +312,11 @@ class VectorStoreService:
         except Exception as e:
             logger.error(f"Vector store health check failed: {str(e)}")
             return False
+
+@functools.lru_cache(maxsize=None)
+def get_vectorstore_service() -> VectorStoreService:
+    """
+    Shared vector store service, so the Chroma client, thread pool and
+    query cache are created once per process
+    """
+    return VectorStoreService()
@@ -2,37 +2,44 @@
 Sample Python project for testing the Code Assistant AI
 """
 
+from dataclasses import dataclass
+from typing import Dict
+
+@dataclass(slots=True)
+class User:
+    """A user record"""
+    username: str
+    email: str
+    created_at: str = '2025-01-01'
+    active: bool = True
+
 class UserManager:
     """Manages user operations"""
     
     def __init__(self):
-        self.users = {}
+        self.users: Dict[str, User] = {}
     
-    def create_user(self, username: str, email: str) -> dict:
+    def create_user(self, username: str, email: str) -> User:
         """Create a new user"""
         if username in self.users:
             raise ValueError("User already exists")
         
-        user = {
-            'username': username,
-            'email': email,
-            'created_at': '2025-01-01',
-            'active': True
-        }
+        user = User(username=username, email=email)
         
         self.users[username] = user
         return user
     
-    def get_user(self, username: str) -> dict:
+    def get_user(self, username: str) -> User:
         """Get user by username"""
         if username not in self.users:
             raise ValueError("User not found")
         return self.users[username]
     
-    def update_user(self, username: str, **kwargs) -> dict:
+    def update_user(self, username: str, **kwargs) -> User:
         """Update user information"""
         user = self.get_user(username)
-        user.update(kwargs)
+        for field, value in kwargs.items():
+            setattr(user, field, value)
         return user
 
 def main():
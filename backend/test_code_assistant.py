@@ -5,33 +5,76 @@ Tests intelligent prompt selection and context-aware responses
 """
 
 import asyncio
+import hashlib
+import io
+import itertools
+import pickle
+import re
 import sys
 import os
+import tempfile
+import time
+from pathlib import Path
 
-# Add the app directory to Python path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
+import numpy as np
+
+# Try to import uvloop for a faster event loop, but don't fail if not available
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+    uvloop = None
 
 from app.services.rag_pipeline import RAGPipeline
-from app.services.embedding_service import EmbeddingService
-from app.services.vectorstore_service import VectorStoreService
+from app.services.embedding_service import get_embedding_service
+from app.services.vectorstore_service import get_vectorstore_service
 from app.services.document_processor import DocumentProcessor
 from app.services.chunking_service import ChunkingService
 
+# Chunks and embeddings of ENHANCED_CODEBASE, reused across runs
+EMBEDDING_CACHE_DIR = Path(tempfile.gettempdir()) / "code_assistant_test_cache"
+
+# Texts per model forward pass when embedding the sample codebase
+EMBED_BATCH = 64
+
 # Enhanced sample codebase for testing
 ENHANCED_CODEBASE = {
     'user_service.py': '''
 from fastapi import HTTPException
 from typing import List, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from cachetools import TTLCache
+import asyncio
+import hashlib
+import os
+import time
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 
+# bcrypt is CPU-bound; hash on worker processes instead of the event loop
+_password_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# Checked against when no user matches, so unknown usernames cost a full bcrypt verify
+_DUMMY_HASH = bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=12))
+
+# Short-lived caches so repeated requests skip JWT verification and user lookups
+TOKEN_CACHE_TTL_SECONDS = 30
+_token_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_user_cache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Issued tokens are reused until they have less than this much validity left
+TOKEN_REUSE_MARGIN = timedelta(hours=1)
+
 class UserService:
     """Service for managing user operations"""
     
     def __init__(self, db_connection):
         self.db = db_connection
         self.secret_key = "your-secret-key"
+        # user_id -> (token, exp timestamp) for tokens still worth reusing
+        self._token_reuse: Dict[int, tuple] = {}
     
     async def create_user(self, username: str, email: str, password: str) -> Dict:
         """
@@ -58,7 +101,10 @@ class UserService:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        loop = asyncio.get_running_loop()
+        password_hash = await loop.run_in_executor(
+            _password_pool, bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt()
+        )
         
         # Create user record
         user_data = {
@@ -89,26 +135,66 @@ class UserService:
         if not user:
             user = await self.get_user_by_email(username)
         
+        loop = asyncio.get_running_loop()
         if not user or not user.get('is_active'):
+            await loop.run_in_executor(_password_pool, bcrypt.checkpw, password.encode('utf-8'), _DUMMY_HASH)
             return None
         
         # Verify password
-        if bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if await loop.run_in_executor(
+            _password_pool, bcrypt.checkpw, password.encode('utf-8'), user['password_hash'].encode('utf-8')
+        ):
             return user
         
         return None
     
     async def create_access_token(self, user_id: int) -> str:
-        """Create JWT access token for user"""
+        """
+        Create JWT access token for user
+        
+        Reuses the user's previous token while it has more than
+        TOKEN_REUSE_MARGIN left, instead of signing a new one per login.
+        """
+        cached = self._token_reuse.get(user_id)
+        if cached and cached[1] - time.time() > TOKEN_REUSE_MARGIN.total_seconds():
+            return cached[0]
+        
+        expires_at = datetime.utcnow() + timedelta(hours=24)
         payload = {
             "user_id": user_id,
-            "exp": datetime.utcnow() + timedelta(hours=24)
+            "exp": expires_at
         }
-        return jwt.encode(payload, self.secret_key, algorithm="HS256")
+        token = jwt.encode(payload, self.secret_key, algorithm="HS256")
+        self._token_reuse[user_id] = (token, time.time() + timedelta(hours=24).total_seconds())
+        return token
+    
+    def verify_token(self, token: str) -> Dict:
+        """
+        Verify a JWT access token and return its payload
+        
+        Verified payloads are cached briefly, never past the token's own expiry.
+        
+        Raises:
+            jwt.InvalidTokenError: If the token is invalid or expired
+        """
+        cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+        cached = _token_cache.get(cache_key)
+        if cached and cached[1] > time.time():
+            return cached[0]
+        
+        payload = jwt.decode(token, self.secret_key, algorithms=["HS256"])
+        expires_at = min(time.time() + TOKEN_CACHE_TTL_SECONDS, payload["exp"])
+        _token_cache[cache_key] = (payload, expires_at)
+        return payload
     
     async def get_user_by_username(self, username: str) -> Optional[Dict]:
         """Get user by username"""
-        return await self.db.get_user_by_field("username", username)
+        user = _user_cache.get(username)
+        if user is None:
+            user = await self.db.get_user_by_field("username", username)
+            if user:
+                _user_cache[username] = user
+        return user
     
     async def get_user_by_email(self, email: str) -> Optional[Dict]:
         """Get user by email"""
@@ -120,6 +206,25 @@ import asyncpg
 import os
 from typing import Dict, List, Optional
 
+INSERT_USER_SQL = """
+    INSERT INTO users (username, email, password_hash, created_at, is_active)
+    VALUES ($1, $2, $3, $4, $5)
+    RETURNING id
+"""
+
+INSERT_USERS_SQL = """
+    INSERT INTO users (username, email, password_hash, created_at, is_active)
+    SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::timestamp[], $5::boolean[])
+    RETURNING id
+"""
+
+# Fixed statements per lookup field so asyncpg can reuse its prepared statements
+USER_COLUMNS = "id, username, email, password_hash, created_at, is_active"
+USER_BY_FIELD_SQL = {
+    "username": f"SELECT {USER_COLUMNS} FROM users WHERE username = $1",
+    "email": f"SELECT {USER_COLUMNS} FROM users WHERE email = $1",
+}
+
 class DatabaseConnection:
     """Database connection and operations"""
     
@@ -127,27 +232,32 @@ class DatabaseConnection:
         self.pool = None
     
     async def connect(self):
-        """Initialize database connection pool"""
+        """
+        Initialize database connection pool
+        
+        create_pool opens min_size connections before returning, so the pool
+        is warm before the first request arrives.
+        """
         self.pool = await asyncpg.create_pool(
             host=os.getenv('DB_HOST', 'localhost'),
             port=int(os.getenv('DB_PORT', 5432)),
             database=os.getenv('DB_NAME', 'myapp'),
             user=os.getenv('DB_USER', 'postgres'),
             password=os.getenv('DB_PASSWORD', 'password'),
-            min_size=1,
-            max_size=10
+            min_size=10,
+            max_size=50,
+            max_inactive_connection_lifetime=300,
+            command_timeout=60,
+            statement_cache_size=1024,
+            max_cached_statement_lifetime=300,
+            server_settings={'application_name': 'myapp'}
         )
     
     async def insert_user(self, user_data: Dict) -> int:
         """Insert new user and return ID"""
-        query = """
-            INSERT INTO users (username, email, password_hash, created_at, is_active)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id
-        """
         async with self.pool.acquire() as conn:
             result = await conn.fetchval(
-                query,
+                INSERT_USER_SQL,
                 user_data['username'],
                 user_data['email'],
                 user_data['password_hash'],
@@ -156,9 +266,19 @@ class DatabaseConnection:
             )
             return result
     
+    async def insert_users(self, users: List[Dict]) -> List[int]:
+        """Insert many users in one round trip and return their IDs"""
+        columns = ('username', 'email', 'password_hash', 'created_at', 'is_active')
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                INSERT_USERS_SQL,
+                *([user[column] for user in users] for column in columns)
+            )
+            return [row['id'] for row in rows]
+    
     async def get_user_by_field(self, field: str, value: str) -> Optional[Dict]:
-        """Get user by any field"""
-        query = f"SELECT * FROM users WHERE {field} = $1"
+        """Get user by a supported lookup field (username or email)"""
+        query = USER_BY_FIELD_SQL[field]
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow(query, value)
             return dict(row) if row else None
@@ -188,11 +308,17 @@ class UserResponse(BaseModel):
     email: str
     is_active: bool
 
+# One connection pool and service for the app, created at startup
+_database = DatabaseConnection()
+_user_service = UserService(_database)
+
+@router.on_event("startup")
+async def connect_database():
+    await _database.connect()
+
 # Dependency injection
-async def get_user_service():
-    db = DatabaseConnection()
-    await db.connect()
-    return UserService(db)
+async def get_user_service() -> UserService:
+    return _user_service
 
 @router.post("/register", response_model=UserResponse)
 async def register_user(
@@ -206,7 +332,7 @@ async def register_user(
             email=request.email,
             password=request.password
         )
-        return UserResponse(
+        return UserResponse.model_construct(
             id=user['id'],
             username=user['username'],
             email=user['email'],
@@ -234,7 +360,7 @@ async def login_user(
     return {
         "access_token": token,
         "token_type": "bearer",
-        "user": UserResponse(
+        "user": UserResponse.model_construct(
             id=user['id'],
             username=user['username'],
             email=user['email'],
@@ -417,6 +543,60 @@ TEST_QUERIES = [
     }
 ]
 
+_WORD_PATTERN = re.compile(r"[a-z0-9_]+")
+
+# Set NO_STREAM_TTY=1 (e.g. in CI) to skip echoing streamed responses
+STREAM_OUTPUT = not os.environ.get("NO_STREAM_TTY")
+
+class Flusher:
+    """
+    Buffers streamed tokens and writes them to stdout in batches,
+    once more than max_chars are pending or max_delay seconds have passed.
+    """
+    
+    def __init__(self, max_chars: int = 256, max_delay: float = 0.05, enabled: bool = True):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.enabled = enabled
+        self._parts = []
+        self._size = 0
+        self._last = time.monotonic()
+    
+    def write(self, text: str):
+        if not self.enabled:
+            return
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size > self.max_chars or time.monotonic() - self._last > self.max_delay:
+            self.flush()
+    
+    def flush(self):
+        if self._parts:
+            sys.stdout.write("".join(self._parts))
+            sys.stdout.flush()
+            self._parts.clear()
+            self._size = 0
+        self._last = time.monotonic()
+
+def _tokenize(text: str) -> frozenset:
+    """Case-folded set of the words in text"""
+    return frozenset(_WORD_PATTERN.findall(text.casefold()))
+
+def _codebase_cache_paths(embedding_service):
+    """
+    Cache file paths keyed on the codebase and the embedding space that encodes it
+    (provider, model, and the backend or hash fallback actually in use)
+    """
+    key_source = repr((
+        sorted(ENHANCED_CODEBASE.items()),
+        embedding_service.embedding_signature
+    ))
+    key = hashlib.sha256(key_source.encode('utf-8')).hexdigest()[:16]
+    return (
+        EMBEDDING_CACHE_DIR / f"enhanced_chunks_{key}.pkl",
+        EMBEDDING_CACHE_DIR / f"enhanced_embeddings_{key}.npy"
+    )
+
 async def test_code_assistant_features():
     """Test the enhanced code assistant with intelligent prompts"""
     print("🚀 Testing Phase 4: Code Assistant Features...")
@@ -425,8 +605,8 @@ async def test_code_assistant_features():
         # Initialize services
         doc_processor = DocumentProcessor()
         chunking_service = ChunkingService()
-        embedding_service = EmbeddingService()
-        vectorstore_service = VectorStoreService()
+        embedding_service = get_embedding_service()
+        vectorstore_service = get_vectorstore_service()
         rag_pipeline = RAGPipeline()
         
         print("✅ Services initialized")
@@ -438,42 +618,61 @@ async def test_code_assistant_features():
         # Process and load the enhanced codebase
         print("\n📚 Loading enhanced codebase...")
         
-        import tempfile
-        with tempfile.TemporaryDirectory() as temp_dir:
-            all_chunks = []
-            
-            for filename, content in ENHANCED_CODEBASE.items():
-                file_path = os.path.join(temp_dir, filename)
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                print(f"  📄 Processing {filename}...")
-                
-                # Process file
-                extracted_content, metadata = await doc_processor.process_file(file_path, filename)
-                chunks = await chunking_service.chunk_document(extracted_content, metadata)
+        # The cache key depends on which embedding model actually loads
+        await embedding_service.warmup()
+        chunks_path, embeddings_path = _codebase_cache_paths(embedding_service)
+        
+        if chunks_path.exists() and embeddings_path.exists():
+            # The codebase is static, so reuse chunks and embeddings from an earlier run
+            print(f"  ♻️ Using cached chunks and embeddings from {EMBEDDING_CACHE_DIR}")
+            with open(chunks_path, 'rb') as f:
+                all_chunks = pickle.load(f)
+            embeddings = np.load(embeddings_path)
+        else:
+            async def _process_one(filename, content):
+                # Process the in-memory file without a round trip through disk
+                extracted_content, metadata = await doc_processor.process_bytes(content.encode('utf-8'), filename)
+                chunks = await asyncio.to_thread(chunking_service.chunk_document_sync, extracted_content, metadata)
                 
-                print(f"    🔪 Created {len(chunks)} chunks")
-                all_chunks.extend(chunks)
-            
-            # Generate embeddings and store
-            print(f"\n💾 Storing {len(all_chunks)} chunks in vector store...")
+                print(f"  📄 Processed {filename}: {len(chunks)} chunks")
+                return chunks
             
-            documents = [chunk['content'] for chunk in all_chunks]
-            metadatas = [chunk['metadata'] for chunk in all_chunks]
-            embeddings = await embedding_service.embed_texts(documents)
+            # Files are independent, so process them concurrently
+            results = await asyncio.gather(*[
+                _process_one(filename, content)
+                for filename, content in ENHANCED_CODEBASE.items()
+            ])
+            all_chunks = list(itertools.chain.from_iterable(results))
             
-            await vectorstore_service.add_documents(
-                documents=documents,
-                metadatas=metadatas,
-                embeddings=embeddings
+            embeddings = await embedding_service.embed_texts(
+                [chunk['content'] for chunk in all_chunks],
+                batch_size=EMBED_BATCH
             )
             
-            print("✅ Codebase loaded successfully")
+            EMBEDDING_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with open(chunks_path, 'wb') as f:
+                pickle.dump(all_chunks, f)
+            np.save(embeddings_path, embeddings)
+        
+        # Store chunks with their embeddings
+        print(f"\n💾 Storing {len(all_chunks)} chunks in vector store...")
+        
+        documents = [chunk['content'] for chunk in all_chunks]
+        metadatas = [chunk['metadata'] for chunk in all_chunks]
+        
+        await vectorstore_service.add_documents(
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=embeddings
+        )
+        
+        print("✅ Codebase loaded successfully")
         
         # Test intelligent prompt selection
         print("\n🧠 Testing Intelligent Prompt Selection...")
         
+        flusher = Flusher(enabled=STREAM_OUTPUT)
+        
         for i, test_case in enumerate(TEST_QUERIES, 1):
             query = test_case["query"]
             query_type = test_case["type"]
@@ -486,28 +685,29 @@ async def test_code_assistant_features():
             print("\nResponse:")
             print("-" * 60)
             
-            # Process query through RAG pipeline
-            response_tokens = []
+            # Process query through RAG pipeline. Only the case-folded text is
+            # needed afterwards, so fold each token as it streams in.
+            response_buffer = io.StringIO()
             async for token in rag_pipeline.process_query(
                 query=query,
                 session_id=f"test-session-{i}",
                 conversation_history=[],
                 top_k=5
             ):
-                response_tokens.append(token)
-                print(token, end="", flush=True)
+                response_buffer.write(token.casefold())
+                flusher.write(token)
+            flusher.flush()
             
-            full_response = "".join(response_tokens)
+            response_folded = response_buffer.getvalue()
             
             print("\n" + "-" * 60)
             
-            # Analyze response quality
-            response_lower = full_response.lower()
-            found_features = []
-            
-            for feature in expected_features:
-                if feature.lower() in response_lower:
-                    found_features.append(feature)
+            # Analyze response quality: tokenize once, then check each feature's words
+            response_words = frozenset(_WORD_PATTERN.findall(response_folded))
+            found_features = [
+                feature for feature in expected_features
+                if _tokenize(feature) <= response_words
+            ]
             
             print(f"✅ Found expected features: {', '.join(found_features)}")
             
@@ -556,4 +756,7 @@ async def test_code_assistant_features():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    asyncio.run(test_code_assistant_features())
+    # uvloop ships with uvicorn[standard] on Linux/macOS; fall back to the default loop elsewhere
+    loop_factory = uvloop.new_event_loop if UVLOOP_AVAILABLE else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(test_code_assistant_features())
@@ -5,18 +5,33 @@ Creates sample files and processes them through the full pipeline
 """
 
 import asyncio
+import json
 import os
 import sys
 import tempfile
 from pathlib import Path
 
+# Prefer orjson for printing metadata when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 # Add the app directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from app.services.document_processor import DocumentProcessor
-from app.services.chunking_service import ChunkingService
-from app.services.embedding_service import EmbeddingService
-from app.services.vectorstore_service import VectorStoreService
+from app.services.chunking_service import ChunkingService, ChunkBatch
+from app.services.embedding_service import get_embedding_service
+from app.services.vectorstore_service import get_vectorstore_service
+
+# Set DOC_TEST_VERBOSE=1 to print details for every chunk
+VERBOSE = os.getenv("DOC_TEST_VERBOSE") == "1"
+
+# Texts per model forward pass when embedding the sample chunks
+EMBED_BATCH = 128
 
 # Sample files to create and process
 SAMPLE_FILES = {
@@ -398,103 +413,146 @@ body {
 '''
 }
 
+# Encoded once at import so each run only has to write the bytes
+_SAMPLE_BYTES = {filename: content.encode('utf-8') for filename, content in SAMPLE_FILES.items()}
+
+def _dump_metadata(metadata: dict) -> str:
+    """Serialize metadata as JSON for display"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(metadata).decode('utf-8')
+    return json.dumps(metadata, ensure_ascii=False)
+
+def _write_file(path: str, data: bytes):
+    """Write data to path with a single write() call"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
 async def test_document_processing():
     """Test the complete document processing pipeline"""
     print("🚀 Testing Document Processing Pipeline...")
     
+    # Load the embedding model while the sample files are written and chunked
+    embedding_service = get_embedding_service()
+    warmup_task = asyncio.create_task(embedding_service.warmup())
+    
     # Create temporary directory for test files
     with tempfile.TemporaryDirectory() as temp_dir:
         print(f"📁 Created temporary directory: {temp_dir}")
         
-        # Create sample files
-        file_paths = {}
-        for filename, content in SAMPLE_FILES.items():
-            file_path = os.path.join(temp_dir, filename)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            file_paths[filename] = file_path
+        # Create sample files, writing them concurrently
+        file_paths = {
+            filename: os.path.join(temp_dir, filename)
+            for filename in SAMPLE_FILES
+        }
+        await asyncio.gather(*[
+            asyncio.to_thread(_write_file, file_paths[filename], data)
+            for filename, data in _SAMPLE_BYTES.items()
+        ])
+        for filename in file_paths:
             print(f"✅ Created {filename}")
         
         # Initialize services
         doc_processor = DocumentProcessor()
         chunking_service = ChunkingService()
-        embedding_service = EmbeddingService()
-        vectorstore_service = VectorStoreService()
+        vectorstore_service = get_vectorstore_service()
         
         print("\n🔧 Services initialized")
         
-        # Process each file
-        all_chunks = []
+        # Process files concurrently, bounding how many chunk at once
+        semaphore = asyncio.Semaphore(os.cpu_count() or 1)
         
-        for filename, file_path in file_paths.items():
-            print(f"\n📄 Processing {filename}...")
+        async def process_one(filename, file_path):
+            # Collect this file's report so concurrent files don't interleave output
+            report = [f"\n📄 Processing {filename}..."]
             
             try:
-                # Step 1: Extract content
-                content, metadata = await doc_processor.process_file(file_path, filename)
-                print(f"  ✅ Extracted {len(content)} characters")
-                print(f"  📋 Metadata: {metadata}")
-                
-                # Step 2: Chunk the content
-                chunks = await chunking_service.chunk_document(content, metadata)
-                print(f"  🔪 Created {len(chunks)} chunks")
-                
-                # Display chunk info
-                for i, chunk in enumerate(chunks):
-                    chunk_meta = chunk['metadata']
-                    chunk_type = chunk_meta.get('chunk_type', 'unknown')
-                    lines = chunk_meta.get('end_line', 0) - chunk_meta.get('start_line', 0) + 1
-                    function_name = chunk_meta.get('function_name', '')
-                    section_title = chunk_meta.get('section_title', '')
+                async with semaphore:
+                    # Step 1: Extract content
+                    content, metadata = await doc_processor.process_file(file_path, filename)
+                    report.append(f"  ✅ Extracted {len(content)} characters")
+                    report.append(f"  📋 Metadata: {_dump_metadata(metadata)}")
                     
-                    info_parts = [f"Chunk {i+1}: {chunk_type}"]
-                    if lines > 0:
-                        info_parts.append(f"{lines} lines")
-                    if function_name:
-                        info_parts.append(f"function: {function_name}")
-                    if section_title:
-                        info_parts.append(f"section: {section_title}")
-                    
-                    print(f"    📝 {' | '.join(info_parts)}")
-                    print(f"    📏 Content length: {len(chunk['content'])} chars")
+                    # Step 2: Chunk the content
+                    batch = ChunkBatch.from_chunks(
+                        await asyncio.to_thread(chunking_service.chunk_document_sync, content, metadata)
+                    )
+                    report.append(f"  🔪 Created {len(batch)} chunks")
                 
-                all_chunks.extend(chunks)
+                # Display per-chunk info only when asked to
+                if VERBOSE:
+                    for i in range(len(batch)):
+                        lines = batch.end_lines[i] - batch.start_lines[i] + 1
+                        function_name = batch.function_names[i]
+                        section_title = batch.section_titles[i]
+                        
+                        info_parts = [f"Chunk {i+1}: {batch.chunk_types[i]}"]
+                        if lines > 0:
+                            info_parts.append(f"{lines} lines")
+                        if function_name:
+                            info_parts.append(f"function: {function_name}")
+                        if section_title:
+                            info_parts.append(f"section: {section_title}")
+                        
+                        report.append(f"    📝 {' | '.join(info_parts)}")
+                        report.append(f"    📏 Content length: {len(batch.contents[i])} chars")
                 
             except Exception as e:
-                print(f"  ❌ Error processing {filename}: {str(e)}")
+                report.append(f"  ❌ Error processing {filename}: {str(e)}")
+                batch = ChunkBatch.from_chunks([])
+            
+            return batch, report
         
-        print(f"\n📊 Total chunks created: {len(all_chunks)}")
+        # Clear existing data
+        await vectorstore_service.clear_collection()
         
-        # Test embedding and vector store
-        if all_chunks:
-            print("\n🔢 Testing embeddings and vector store...")
-            
-            # Clear existing data
-            await vectorstore_service.clear_collection()
-            
-            # Process chunks in batches
-            batch_size = 5
-            for i in range(0, len(all_chunks), batch_size):
-                batch = all_chunks[i:i + batch_size]
-                
-                print(f"  📦 Processing batch {i//batch_size + 1}/{(len(all_chunks) + batch_size - 1)//batch_size}")
-                
-                # Extract content and metadata
-                documents = [chunk['content'] for chunk in batch]
-                metadatas = [chunk['metadata'] for chunk in batch]
-                
-                # Generate embeddings
-                embeddings = await embedding_service.embed_texts(documents)
-                print(f"    🔢 Generated {len(embeddings)} embeddings")
-                
-                # Add to vector store
+        # Chunking, embedding and storing run as a pipeline, so one file is
+        # embedded while the next is still being chunked
+        chunks_queue = asyncio.Queue(maxsize=4)
+        embeddings_queue = asyncio.Queue(maxsize=4)
+        total_chunks = 0
+        
+        async def producer():
+            nonlocal total_chunks
+            tasks = [
+                asyncio.create_task(process_one(filename, file_path))
+                for filename, file_path in file_paths.items()
+            ]
+            for next_done in asyncio.as_completed(tasks):
+                batch, report = await next_done
+                print("\n".join(report))
+                if batch:
+                    total_chunks += len(batch)
+                    await chunks_queue.put(batch)
+            await chunks_queue.put(None)
+        
+        async def embedder():
+            await warmup_task
+            while (batch := await chunks_queue.get()) is not None:
+                embeddings = await embedding_service.embed_texts(batch.contents, batch_size=EMBED_BATCH)
+                await embeddings_queue.put((batch, embeddings))
+            await embeddings_queue.put(None)
+        
+        async def writer():
+            stored = 0
+            while (item := await embeddings_queue.get()) is not None:
+                batch, embeddings = item
                 doc_ids = await vectorstore_service.add_documents(
-                    documents=documents,
-                    metadatas=metadatas,
+                    documents=batch.contents,
+                    metadatas=batch.metadatas,
                     embeddings=embeddings
                 )
-                print(f"    💾 Added {len(doc_ids)} documents to vector store")
-            
+                stored += len(doc_ids)
+            return stored
+        
+        _, _, stored = await asyncio.gather(producer(), embedder(), writer())
+        
+        print(f"\n📊 Total chunks created: {total_chunks}")
+        print(f"💾 Embedded and added {stored} documents to vector store")
+        
+        if total_chunks:
             # Test retrieval
             print("\n🔍 Testing retrieval...")
             test_queries = [
@@ -504,30 +562,33 @@ async def test_document_processing():
                 "How to install the project?"
             ]
             
-            for query in test_queries:
-                print(f"\n  🔎 Query: {query}")
-                
-                # Get query embedding
-                query_embedding = await embedding_service.embed_text(query)
-                
-                # Search vector store
-                results = await vectorstore_service.query_similar(
+            # Embed all queries in one batch, then run the searches concurrently
+            query_embeddings = await embedding_service.embed_texts(test_queries)
+            all_results = await asyncio.gather(*[
+                vectorstore_service.query_similar(
                     query_embedding=query_embedding,
                     n_results=3
                 )
+                for query_embedding in query_embeddings.tolist()
+            ])
+            
+            for query, results in zip(test_queries, all_results):
+                print(f"\n  🔎 Query: {query}")
                 
                 print(f"    📋 Found {len(results['documents'])} relevant chunks:")
                 
-                for j, (doc, metadata, distance) in enumerate(zip(
+                # Convert all distances in one vectorized step
+                similarities = 1.0 - results['distances']
+                
+                for j, (doc, metadata, similarity) in enumerate(zip(
                     results['documents'], 
                     results['metadatas'], 
-                    results['distances']
+                    similarities.tolist()
                 )):
                     filename = metadata.get('filename', 'unknown')
                     chunk_type = metadata.get('chunk_type', 'unknown')
                     function_name = metadata.get('function_name', '')
                     section_title = metadata.get('section_title', '')
-                    similarity = 1 - distance
                     
                     info_parts = [f"{filename}"]
                     if function_name:
@@ -5,6 +5,8 @@ Run this after starting the backend to test RAG functionality
 """
 
 import asyncio
+import hashlib
+import json
 import sys
 import os
 
@@ -12,8 +14,11 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
 from app.services.rag_pipeline import RAGPipeline
-from app.services.embedding_service import EmbeddingService
-from app.services.vectorstore_service import VectorStoreService
+from app.services.embedding_service import get_embedding_service
+from app.services.vectorstore_service import get_vectorstore_service
+
+# Streamed characters to accumulate before writing them to stdout
+STREAM_BUFFER_CHARS = 256
 
 # Sample code documents for testing
 SAMPLE_DOCUMENTS = [
@@ -197,45 +202,73 @@ The application uses PostgreSQL with the following tables:
     }
 ]
 
+# Split once at import
+_DOCUMENT_TEXTS = [doc["content"] for doc in SAMPLE_DOCUMENTS]
+_DOCUMENT_METADATAS = [doc["metadata"] for doc in SAMPLE_DOCUMENTS]
+
+def _fixture_hash(embedding_service) -> str:
+    """
+    Hash stored with every sample chunk, so unchanged fixtures aren't re-embedded
+    on the next run. Covers the documents and the embedding setup, since vectors
+    from a different model, backend or the hash fallback aren't comparable.
+    """
+    key_source = json.dumps({
+        'documents': SAMPLE_DOCUMENTS,
+        'embedding': embedding_service.embedding_signature
+    }, sort_keys=True)
+    return hashlib.blake2b(key_source.encode('utf-8'), digest_size=16).hexdigest()
+
 async def test_rag_pipeline():
     """Test the RAG pipeline by adding sample documents"""
     print("🚀 Testing RAG Pipeline...")
     
     try:
         # Initialize services
-        embedding_service = EmbeddingService()
-        vectorstore_service = VectorStoreService()
+        embedding_service = get_embedding_service()
+        vectorstore_service = get_vectorstore_service()
         rag_pipeline = RAGPipeline()
         
+        # Load the embedding model while the knowledge base is checked and cleared
+        warmup_task = asyncio.create_task(embedding_service.warmup())
+        
         print("✅ Services initialized")
         
         # Check initial status
         initial_status = await rag_pipeline.get_pipeline_status()
         print(f"📊 Initial status: {initial_status['total_chunks']} chunks")
         
-        # Clear existing documents
-        if initial_status['total_chunks'] > 0:
-            print("🗑️ Clearing existing documents...")
-            await rag_pipeline.clear_knowledge_base()
-        
-        # Add sample documents
-        print("📝 Adding sample documents...")
-        documents = [doc["content"] for doc in SAMPLE_DOCUMENTS]
-        metadatas = [doc["metadata"] for doc in SAMPLE_DOCUMENTS]
-        
-        # Generate embeddings
-        print("🔢 Generating embeddings...")
-        embeddings = await embedding_service.embed_texts(documents)
-        
-        # Add to vector store
-        print("💾 Adding to vector store...")
-        doc_ids = await vectorstore_service.add_documents(
-            documents=documents,
-            metadatas=metadatas,
-            embeddings=embeddings
-        )
+        # The fixture hash depends on which embedding model actually loaded
+        await warmup_task
+        fixture_hash = _fixture_hash(embedding_service)
         
-        print(f"✅ Added {len(doc_ids)} documents to vector store")
+        stored_hashes = await vectorstore_service.get_metadata_values('fixture_hash')
+        if (initial_status['total_chunks'] == len(SAMPLE_DOCUMENTS)
+                and stored_hashes == [fixture_hash] * len(SAMPLE_DOCUMENTS)):
+            print("♻️ Sample documents unchanged, reusing stored embeddings")
+        else:
+            # Clear existing documents
+            if initial_status['total_chunks'] > 0:
+                print("🗑️ Clearing existing documents...")
+                await rag_pipeline.clear_knowledge_base()
+            
+            # Add sample documents
+            print("📝 Adding sample documents...")
+            documents = _DOCUMENT_TEXTS
+            metadatas = [{**metadata, 'fixture_hash': fixture_hash} for metadata in _DOCUMENT_METADATAS]
+            
+            # Generate embeddings
+            print("🔢 Generating embeddings...")
+            embeddings = await embedding_service.embed_texts(documents)
+            
+            # Add to vector store
+            print("💾 Adding to vector store...")
+            doc_ids = await vectorstore_service.add_documents(
+                documents=documents,
+                metadatas=metadatas,
+                embeddings=embeddings
+            )
+            
+            print(f"✅ Added {len(doc_ids)} documents to vector store")
         
         # Check final status
         final_status = await rag_pipeline.get_pipeline_status()
@@ -248,13 +281,24 @@ async def test_rag_pipeline():
         print(f"Query: {test_query}")
         print("Response:")
         
+        # Buffer tokens and write them out in batches rather than one syscall per token
+        buffer = []
+        buffered_chars = 0
         async for token in rag_pipeline.process_query(
             query=test_query,
             session_id="test-session",
             conversation_history=[],
             top_k=3
         ):
-            print(token, end="", flush=True)
+            buffer.append(token)
+            buffered_chars += len(token)
+            if buffered_chars >= STREAM_BUFFER_CHARS or '\n' in token:
+                sys.stdout.write(''.join(buffer))
+                sys.stdout.flush()
+                buffer.clear()
+                buffered_chars = 0
+        sys.stdout.write(''.join(buffer))
+        sys.stdout.flush()
         
         print("\n\n✅ RAG Pipeline test completed successfully!")
         
@@ -13,60 +13,67 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Load custom CSS
-css_path = os.path.join(os.path.dirname(__file__), 'styles', 'chatgpt_theme.css')
-if os.path.exists(css_path):
+HEADER_HTML = """
+        <div class="header">
+            <h1>🤖 AI Assistant</h1>
+            <p style="margin: 0; color: rgba(255,255,255,0.8);">Unified RAG + LLM - One Chat for Everything</p>
+        </div>
+        """
+
+FOOTER_HTML = """
+        <div style="text-align: center; color: #8E8EA0; font-size: 0.8rem;">
+            <p>🚀 <strong>AI Assistant v1.0.0</strong> | Powered by Groq & ChromaDB</p>
+            <p>✅ <strong>UNIFIED EXPERIENCE</strong> | RAG + LLM in One Chat</p>
+            <p>🧠 Smart Context • 🔍 408 Knowledge Chunks • 💡 Intelligent Responses</p>
+        </div>
+        """
+
+@st.cache_resource
+def _load_css() -> str:
+    """Read the theme stylesheet once per server process"""
+    css_path = os.path.join(os.path.dirname(__file__), 'styles', 'chatgpt_theme.css')
+    if not os.path.exists(css_path):
+        return ""
     with open(css_path) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+        return f'<style>{f.read()}</style>'
+
+# Load custom CSS
+css_block = _load_css()
+if css_block:
+    st.markdown(css_block, unsafe_allow_html=True)
 
 # Initialize session state
 initialize_session_state()
 
-# Initialize API client
-backend_url = os.getenv("BACKEND_URL", "http://localhost:8000")
-api_client = APIClient(backend_url=backend_url)
+@st.cache_resource
+def get_api_client(backend_url: str) -> APIClient:
+    """Shared API client per backend, so its HTTP session and keep-alive connections survive reruns"""
+    return APIClient(backend_url=backend_url)
 
 def main():
     """
     Main application function
     """
+    api_client = get_api_client(os.getenv("BACKEND_URL", "http://localhost:8000"))
+    
     # Header
-    st.markdown(
-        """
-        <div class="header">
-            <h1>🤖 AI Assistant</h1>
-            <p style="margin: 0; color: rgba(255,255,255,0.8);">Unified RAG + LLM - One Chat for Everything</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(HEADER_HTML, unsafe_allow_html=True)
     
     # Sidebar
     mode, upload_status = render_sidebar(api_client)
-    render_conversation_controls()
+    message_count_placeholder = render_conversation_controls()
     
-    # Main content area
-    col1, col2, col3 = st.columns([1, 10, 1])
+    # Main content area; not wrapped in columns, since st.chat_input
+    # must be rendered at the top level of the page
+    # Show welcome message if no conversation
+    render_welcome_message()
     
-    with col2:
-        # Show welcome message if no conversation
-        render_welcome_message()
-        
-        # Main chat interface
-        render_chat_interface(api_client, mode, upload_status)
+    # Main chat interface
+    render_chat_interface(api_client, mode, upload_status, message_count_placeholder)
     
     # Footer
     st.markdown("---")
-    st.markdown(
-        """
-        <div style="text-align: center; color: #8E8EA0; font-size: 0.8rem;">
-            <p>🚀 <strong>AI Assistant v1.0.0</strong> | Powered by Groq & ChromaDB</p>
-            <p>✅ <strong>UNIFIED EXPERIENCE</strong> | RAG + LLM in One Chat</p>
-            <p>🧠 Smart Context • 🔍 408 Knowledge Chunks • 💡 Intelligent Responses</p>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
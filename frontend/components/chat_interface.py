@@ -1,10 +1,40 @@
 import streamlit as st
 from datetime import datetime
+import html
 import time
 
-def render_message(role: str, content: str, timestamp: str = None):
+# Minimum seconds between re-renders of a streaming response
+STREAM_RENDER_INTERVAL = 0.03
+
+# Prior messages sent to the backend with each question. The backend only puts
+# the most recent few into the prompt, so older turns just inflate the payload
+MAX_HISTORY_MESSAGES = 20
+
+# Display format for message timestamps, rendered once when a message is stored
+TIME_FORMAT = "%I:%M %p"
+
+# st.write_stream (Streamlit >= 1.31) streams a generator natively;
+# on older versions tokens are rendered through a placeholder instead
+_write_stream = getattr(st, 'write_stream', None)
+
+def _markdown_body(content: str) -> str:
+    """
+    Normalize assistant markdown for embedding between raw HTML lines:
+    unify line endings and close a dangling code fence, so one reply can't
+    swallow the bubbles rendered after it
     """
-    Render a single message bubble with styling
+    body = content.replace("\r\n", "\n").strip("\n")
+    if body.count("```") % 2:
+        body += "\n```"
+    return body
+
+def build_message_html(role: str, content: str, time_str: str = "") -> str:
+    """
+    Build the HTML for a single message bubble, with no indentation so bubbles
+    can be joined into one markdown element.
+    User text is escaped, with newlines as character references (shown as line
+    breaks by the pre-wrap message style). Assistant text is kept as markdown,
+    set off by blank lines so it is rendered as markdown inside the bubble.
     """
     is_user = role == 'user'
     
@@ -12,51 +42,53 @@ def render_message(role: str, content: str, timestamp: str = None):
     bubble_class = "user-bubble" if is_user else "assistant-bubble"
     icon = "👤" if is_user else "🤖"
     
-    # Format timestamp
-    time_str = ""
-    if timestamp:
-        try:
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            time_str = dt.strftime("%I:%M %p")
-        except:
-            time_str = ""
+    if is_user:
+        text_html = html.escape(content).replace("\r\n", "\n").replace("\n", "&#10;")
+    else:
+        text_html = f"\n\n{_markdown_body(content)}\n\n"
+    timestamp_html = f'<div class="message-timestamp">{time_str}</div>' if time_str else ''
+    icon_html = f'<div class="message-icon">{icon}</div>'
+    content_html = f'<div class="message-content"><div class="message-text">{text_html}</div>{timestamp_html}</div>'
     
-    # Render message
-    with st.container():
-        col1, col2, col3 = st.columns([1, 8, 1])
-        
-        if is_user:
-            # User message (right-aligned)
-            with col2:
-                st.markdown(
-                    f"""
-                    <div class="message-container {bubble_class}">
-                        <div class="message-content">
-                            <div class="message-text">{content}</div>
-                            {f'<div class="message-timestamp">{time_str}</div>' if time_str else ''}
-                        </div>
-                        <div class="message-icon">{icon}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-        else:
-            # Assistant message (left-aligned)
-            with col2:
-                st.markdown(
-                    f"""
-                    <div class="message-container {bubble_class}">
-                        <div class="message-icon">{icon}</div>
-                        <div class="message-content">
-                            <div class="message-text">{content}</div>
-                            {f'<div class="message-timestamp">{time_str}</div>' if time_str else ''}
-                        </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+    # User messages are right-aligned (icon last), assistant messages left-aligned (icon first)
+    inner = f"{content_html}{icon_html}" if is_user else f"{icon_html}{content_html}"
+    return f'<div class="message-container {bubble_class}">{inner}</div>\n'
+
+def _track_first_token(tokens, status):
+    """
+    Pass tokens through, relabelling the status indicator when the first one arrives
+    """
+    tokens = iter(tokens)
+    for token in tokens:
+        status.update(label="✍️ Responding...")
+        yield token
+        break
+    yield from tokens
+
+def _history_block(bubbles_html: str) -> str:
+    """
+    Wrap bubble HTML in the history container styled by the theme CSS
+    """
+    return f'<div class="chat-history">{bubbles_html}</div>'
+
+def _render_history():
+    """
+    Render the stored message history as a single markdown element
+    """
+    messages = st.session_state.get('messages', [])
+    if not messages:
+        return
+    
+    history_html = "".join(
+        message.get('_html') or build_message_html(message['role'], message['content'], message.get('time_str', ''))
+        for message in messages
+    )
+    
+    # One element for every bubble, instead of one per message; the bubbles are
+    # aligned and padded by the theme CSS rather than a column layout
+    st.markdown(_history_block(history_html), unsafe_allow_html=True)
 
-def render_chat_interface(api_client, mode, upload_status):
+def render_chat_interface(api_client, mode, upload_status, message_count_placeholder=None):
     """
     Render main chat interface with message history and input
     """
@@ -65,93 +97,107 @@ def render_chat_interface(api_client, mode, upload_status):
     
     with chat_container:
         # Render message history
-        for message in st.session_state.get('messages', []):
-            render_message(
-                role=message['role'],
-                content=message['content'],
-                timestamp=message.get('timestamp')
-            )
-    
-    # Input area
-    st.markdown("---")
+        _render_history()
     
     # Input is always enabled for unified mode
     input_disabled = False
     placeholder_text = "Ask me anything about your project or general questions..."
     
-    # Input form
-    with st.form("chat_form", clear_on_submit=True):
-        col1, col2 = st.columns([9, 1])
-        
-        with col1:
-            user_input = st.text_area(
-                "Message",
-                placeholder=placeholder_text,
-                disabled=input_disabled,
-                label_visibility="collapsed",
-                height=100,
-                key="user_input_area"
-            )
-        
-        with col2:
-            send_button = st.form_submit_button(
-                "🚀 Send", 
-                use_container_width=True,
-                disabled=input_disabled
-            )
+    # Chat input is pinned to the bottom of the page and clears itself on submit
+    user_input = st.chat_input(placeholder_text, disabled=input_disabled)
     
     # Handle message sending
-    if send_button and user_input.strip():
+    if user_input and user_input.strip():
         # Add user message to history
+        now = datetime.now()
         user_message = {
             'role': 'user',
             'content': user_input.strip(),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': now.isoformat(),
+            'time_str': now.strftime(TIME_FORMAT)
         }
+        # Message content never changes once stored, so build its markup once
+        user_message['_html'] = build_message_html('user', user_message['content'], user_message['time_str'])
         st.session_state['messages'].append(user_message)
+        st.session_state['history_payload'].append({'role': 'user', 'content': user_message['content']})
         
-        # Show typing indicator
-        with st.spinner("🤖 Assistant is thinking..."):
-            # Create placeholder for streaming response
-            response_placeholder = st.empty()
-            
-            try:
-                # Always use RAG-enhanced chat (unified mode)
-                conversation_history = [
-                    {"role": msg["role"], "content": msg["content"]} 
-                    for msg in st.session_state['messages'][:-1]  # Exclude current message
-                ]
-                response_generator = api_client.chat_code_assistant(
+        # The history above was rendered before this message was added
+        st.markdown(_history_block(user_message['_html']), unsafe_allow_html=True)
+        
+        # Status indicator while the answer is prepared; relabelled on the first
+        # token instead of wrapping the whole stream in a spinner
+        status = st.status("🤖 Assistant is thinking...", expanded=False)
+        
+        # Stream the reply into an assistant chat message, held in a
+        # placeholder so it can be swapped for the final bubble
+        reply_placeholder = st.empty()
+        assistant_container = reply_placeholder.chat_message("assistant", avatar="🤖")
+        response_placeholder = assistant_container.empty()
+        
+        try:
+            # Always use RAG-enhanced chat (unified mode)
+            # Last MAX_HISTORY_MESSAGES turns, excluding the current message
+            conversation_history = st.session_state['history_payload'][-(MAX_HISTORY_MESSAGES + 1):-1]
+            response_generator = _track_first_token(
+                api_client.chat_code_assistant(
                     message=user_input.strip(),
                     session_id=st.session_state.get('session_id'),
                     conversation_history=conversation_history
-                )
-                
-                # Stream the response
-                full_response = ""
+                ),
+                status
+            )
+            
+            if _write_stream is not None:
+                # Let Streamlit consume the generator directly
+                with response_placeholder.container():
+                    full_response = _write_stream(response_generator)
+            else:
+                # Stream the response, re-rendering at most every STREAM_RENDER_INTERVAL
+                # seconds or at word and line boundaries
+                # Tokens are collected in a list and only joined when rendering
+                response_parts = []
+                last_render = 0.0
                 for token in response_generator:
-                    full_response += token
-                    # Update the placeholder with accumulated response
-                    response_placeholder.markdown(f"🤖 **Assistant**: {full_response}")
-                    time.sleep(0.01)  # Small delay for smooth streaming effect
-                
-                # Add assistant response to history
-                assistant_message = {
-                    'role': 'assistant',
-                    'content': full_response,
-                    'timestamp': datetime.now().isoformat()
-                }
-                st.session_state['messages'].append(assistant_message)
-                
-                # Clear the placeholder and rerun to show final messages
-                response_placeholder.empty()
+                    response_parts.append(token)
+                    now = time.monotonic()
+                    if now - last_render > STREAM_RENDER_INTERVAL or token.endswith((' ', '\n')):
+                        response_placeholder.markdown(''.join(response_parts))
+                        last_render = now
+                full_response = "".join(response_parts)
+                response_placeholder.markdown(full_response)
+            
+            status.update(label="✅ Response complete", state="complete")
+            
+            # Add assistant response to history
+            now = datetime.now()
+            assistant_message = {
+                'role': 'assistant',
+                'content': full_response,
+                'timestamp': now.isoformat(),
+                'time_str': now.strftime(TIME_FORMAT)
+            }
+            assistant_message['_html'] = build_message_html('assistant', full_response, assistant_message['time_str'])
+            st.session_state['messages'].append(assistant_message)
+            st.session_state['history_payload'].append({'role': 'assistant', 'content': full_response})
+            
+            # The first exchange hides the welcome panel and adds the clear
+            # button in the sidebar, which only a full rerun can update
+            if len(st.session_state['messages']) == 2:
                 st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-                # Remove the user message if there was an error
-                if st.session_state['messages'] and st.session_state['messages'][-1] == user_message:
-                    st.session_state['messages'].pop()
+            
+            # Otherwise replace the streamed reply with its final bubble in place;
+            # the next rerun renders both messages as part of the history
+            reply_placeholder.markdown(_history_block(assistant_message['_html']), unsafe_allow_html=True)
+            if message_count_placeholder is not None:
+                message_count_placeholder.caption(f"Messages: {len(st.session_state['messages'])}")
+            
+        except Exception as e:
+            status.update(label="❌ Response failed", state="error")
+            st.error(f"Error: {str(e)}")
+            # Remove the user message if there was an error
+            if st.session_state['messages'] and st.session_state['messages'][-1] == user_message:
+                st.session_state['messages'].pop()
+                st.session_state['history_payload'].pop()
 
 def render_welcome_message():
     """
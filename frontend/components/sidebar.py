@@ -27,6 +27,7 @@ def render_sidebar(api_client) -> Tuple[str, Dict]:
 def render_conversation_controls():
     """
     Render conversation control buttons in sidebar
+    Returns the message count placeholder, so it can be refreshed without a rerun
     """
     with st.sidebar:
         st.markdown("---")
@@ -36,6 +37,7 @@ def render_conversation_controls():
         if st.session_state.get('messages'):
             if st.button("🗑️ Clear Conversation", use_container_width=True):
                 st.session_state['messages'] = []
+                st.session_state['history_payload'] = []
                 st.success("Conversation cleared!")
                 st.rerun()
         
@@ -45,7 +47,10 @@ def render_conversation_controls():
         
         # Message count
         message_count = len(st.session_state.get('messages', []))
-        st.caption(f"Messages: {message_count}")
+        message_count_placeholder = st.empty()
+        message_count_placeholder.caption(f"Messages: {message_count}")
         
         # Current mode
         st.caption("Mode: Unified RAG + LLM")
+    
+    return message_count_placeholder
@@ -1,11 +1,80 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Any, Generator
 import streamlit as st
 import json
 import logging
 
+# Prefer orjson for encoding chat requests and parsing streamed events when installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize a request body to UTF-8 JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+# Streaming responses must not be gzip-buffered or cached on the way to the client
+STREAM_HEADERS = {
+    'Accept': 'text/event-stream',
+    'Accept-Encoding': 'identity',
+    'Cache-Control': 'no-cache'
+}
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_health_check(backend_url: str, _session: requests.Session) -> Dict[str, Any]:
+    """Backend health, shared across reruns for a few seconds"""
+    try:
+        response = _session.get(f"{backend_url}/health")
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        return {"status": "unhealthy", "error": str(e)}
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _cached_code_assistant_status(backend_url: str, _session: requests.Session) -> Dict[str, Any]:
+    """Uploaded document status, which only changes on upload or clear"""
+    try:
+        response = _session.get(
+            f"{backend_url}/api/code-assistant/status"
+        )
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logger.error(f"Error getting status: {str(e)}")
+        return {
+            "is_ready": False,
+            "documents_count": 0,
+            "chunks_count": 0,
+            "error": str(e)
+        }
+
+def iter_sse_data(response: requests.Response) -> Generator[bytes, None, None]:
+    """
+    Incrementally parse a server-sent event stream, yielding each event's
+    data payload as soon as the blank line ending the event arrives
+    """
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=None):
+        buffer += chunk
+        while (end := buffer.find(b"\n\n")) != -1:
+            event = bytes(buffer[:end])
+            del buffer[:end + 2]
+            for line in event.split(b"\n"):
+                if line.startswith(b"data: "):
+                    yield line[6:]
+
 class APIClient:
     """
     Client for communicating with FastAPI backend
@@ -17,32 +86,42 @@ class APIClient:
         self.session.headers.update({
             'Content-Type': 'application/json'
         })
+        
+        # Larger connection pool plus retries on transient gateway errors.
+        # Retry leaves POST alone by default, so chat requests are never replayed.
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
     
     def chat_general(self, message: str, session_id: str) -> Generator[str, None, None]:
         """Send message to general chat endpoint and yield streaming tokens"""
         try:
             response = self.session.post(
                 f"{self.backend_url}/api/chat/general",
-                json={
+                data=_json_dumps({
                     "message": message,
                     "session_id": session_id,
                     "conversation_history": []
-                },
+                }),
+                headers=STREAM_HEADERS,
                 stream=True
             )
             response.raise_for_status()
             
             # Handle streaming response
-            for line in response.iter_lines(decode_unicode=True):
-                if line.startswith('data: '):
-                    try:
-                        data = json.loads(line[6:])  # Remove 'data: ' prefix
-                        if data.get('token'):
-                            yield data['token']
-                        if data.get('complete'):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+            for payload in iter_sse_data(response):
+                try:
+                    data = _json_loads(payload)
+                    if data.get('token'):
+                        yield data['token']
+                    if data.get('complete'):
+                        break
+                except json.JSONDecodeError:
+                    continue
                         
         except Exception as e:
             logger.error(f"Error in chat_general: {str(e)}")
@@ -58,47 +137,34 @@ class APIClient:
         try:
             response = self.session.post(
                 f"{self.backend_url}/api/chat/code-assistant",
-                json={
+                data=_json_dumps({
                     "message": message,
                     "session_id": session_id,
                     "conversation_history": conversation_history or []
-                },
+                }),
+                headers=STREAM_HEADERS,
                 stream=True
             )
             response.raise_for_status()
             
             # Handle streaming response
-            for line in response.iter_lines(decode_unicode=True):
-                if line.startswith('data: '):
-                    try:
-                        data = json.loads(line[6:])  # Remove 'data: ' prefix
-                        if data.get('token'):
-                            yield data['token']
-                        if data.get('complete'):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+            for payload in iter_sse_data(response):
+                try:
+                    data = _json_loads(payload)
+                    if data.get('token'):
+                        yield data['token']
+                    if data.get('complete'):
+                        break
+                except json.JSONDecodeError:
+                    continue
                         
         except Exception as e:
             logger.error(f"Error in chat_code_assistant: {str(e)}")
             yield f"Error: {str(e)}"
     
     def get_code_assistant_status(self) -> Dict[str, Any]:
-        """Get status of uploaded documents"""
-        try:
-            response = self.session.get(
-                f"{self.backend_url}/api/code-assistant/status"
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error getting status: {str(e)}")
-            return {
-                "is_ready": False,
-                "documents_count": 0,
-                "chunks_count": 0,
-                "error": str(e)
-            }
+        """Get status of uploaded documents (cached briefly; cleared when documents are cleared)"""
+        return _cached_code_assistant_status(self.backend_url, self.session)
     
     
     def clear_code_assistant(self) -> Dict[str, Any]:
@@ -108,6 +174,7 @@ class APIClient:
                 f"{self.backend_url}/api/code-assistant/clear"
             )
             response.raise_for_status()
+            _cached_code_assistant_status.clear()
             return response.json()
         except Exception as e:
             return {"error": str(e)}
@@ -125,10 +192,5 @@ class APIClient:
             return {"error": str(e)}
     
     def health_check(self) -> Dict[str, Any]:
-        """Check if backend is healthy"""
-        try:
-            response = self.session.get(f"{self.backend_url}/health")
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"status": "unhealthy", "error": str(e)}
+        """Check if backend is healthy (cached briefly, since the sidebar asks on every rerun)"""
+        return _cached_health_check(self.backend_url, self.session)
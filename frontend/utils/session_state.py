@@ -5,30 +5,32 @@ def initialize_session_state():
     """
     Initialize Streamlit session state variables
     """
-    # Session ID for backend communication
-    if 'session_id' not in st.session_state:
-        st.session_state['session_id'] = str(uuid.uuid4())
+    ss = st.session_state
+    
+    # Session ID for backend communication; checked explicitly so a uuid
+    # is only generated when the key is missing
+    if 'session_id' not in ss:
+        ss['session_id'] = str(uuid.uuid4())
     
     # Chat mode (unified RAG + LLM)
-    if 'mode' not in st.session_state:
-        st.session_state['mode'] = 'unified'
+    ss.setdefault('mode', 'unified')
     
     # Message history
-    if 'messages' not in st.session_state:
-        st.session_state['messages'] = []
+    ss.setdefault('messages', [])
+    
+    # Role/content view of the message history in the shape the backend expects,
+    # appended in lockstep with messages
+    ss.setdefault('history_payload', [])
     
     # Upload status for code assistant
-    if 'upload_status' not in st.session_state:
-        st.session_state['upload_status'] = {
-            'is_ready': False,
-            'documents_count': 0,
-            'chunks_count': 0
-        }
+    ss.setdefault('upload_status', {
+        'is_ready': False,
+        'documents_count': 0,
+        'chunks_count': 0
+    })
     
     # Current input
-    if 'current_input' not in st.session_state:
-        st.session_state['current_input'] = ""
+    ss.setdefault('current_input', "")
     
     # Loading state
-    if 'is_loading' not in st.session_state:
-        st.session_state['is_loading'] = False
+    ss.setdefault('is_loading', False)